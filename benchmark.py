@@ -0,0 +1,244 @@
+'''
+Runs the bot end to end against the fakes in fakes.py with synthetic rosters of different sizes,
+and reports how long each cycle took, how many calls it made to each service (with the latency
+of each kind of call from metrics.py), and how much memory it used. Chrome is still used to read the
+fake TigerQuest, so chromedriver must be available, unless the HTTP backend is run with --fake-browser.
+
+    python benchmark.py                    # rosters of 10, 100, 1000 and 10000 applicants
+    python benchmark.py 50 500 --backend http --output results.jsonl
+    python benchmark.py 100 --browser-profile trimmed   # headless Chrome without images, fonts, or analytics
+    python benchmark.py 100 --backend http --fake-browser   # no Chrome at all, see fakes.FakeBrowser
+
+Each roster size runs in its own process, in a temporary folder with its own auth.toml and
+database, so that the sizes do not share caches or memory. Half of the applicants are already
+in the sheet with a mix of statuses, and one in ten of those has emailed in a membership number.
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+import fakes
+
+REPO_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+SETTINGS = '''Debug = false
+
+[System]
+database_file = 'benchmark.db'
+
+[ClemsonAuth]
+login_domain = 'login.invalid'
+username = ''
+password = ''
+
+[GoogleSheets]
+spreadsheet_id = 'benchmark'
+
+[Gmail]
+president_name = 'Benchmark President'
+sends_per_second = {sends_per_second}
+send_burst = {sends_per_second}
+
+[SeleniumDriver]
+path = '{chromedriver}'
+{browser_settings}
+
+[TigerQuest]
+prospective_member_url = '{url}/roster'
+approve_member_url = '{url}/approve/'
+reject_member_url = '{url}/deny/'
+scrape_backend = '{backend}'
+'''
+
+# [SeleniumDriver] settings for each --browser-profile
+BROWSER_PROFILES = {
+    'default': '',
+    'trimmed': '''headless = true
+window_size = [1024, 768]
+block_resources = true
+user_data_dir = 'chrome-profile'
+''',
+}
+
+def make_applicants(size: int) -> list[tuple[str, str, str]]:
+    '''
+    Returns (id, name, email) for each synthetic applicant. Some use the @g.clemson.edu form of their address.
+    '''
+    return [
+        (str(100000 + index), f'Applicant{index} Test', f'applicant{index}@{"g." if index % 7 == 0 else ""}clemson.edu')
+        for index in range(size)
+    ]
+
+def make_sheet(applicants: list[tuple[str, str, str]]) -> list[list[str]]:
+    '''
+    Returns the sheet rows for the benchmark. Half of the applicants are in the sheet: most were sent
+    the interest email today, some are due a reminder, and some are past their time limit. There
+    are also approved members from earlier who are no longer on the roster.
+    '''
+    today = datetime.now().strftime('%m/%d/%y')
+    week_ago = (datetime.now() - timedelta(days=8)).strftime('%m/%d/%y')
+    values = [['Name', 'Email', 'Membership ID', 'Status', 'Status Date']]
+    for index, (id, name, email) in enumerate(applicants[:len(applicants) // 2]):
+        if index % 5 == 3:
+            values.append([name, email, '', 'EMAIL SENT', week_ago])
+        elif index % 5 == 4:
+            values.append([name, email, '', 'REMINDER SENT', week_ago])
+        else:
+            values.append([name, email, '', 'EMAIL SENT', today])
+    for index in range(len(applicants) // 2):
+        values.append([f'Member{index} Test', f'member{index}@clemson.edu', str(900000000 + index), 'APPROVED', week_ago])
+    return values
+
+def fill_inbox(mailbox: fakes.FakeGmail, applicants: list[tuple[str, str, str]]):
+    '''
+    Adds a membership number reply from one in ten of the applicants that are already in the sheet.
+    '''
+    for index, (id, name, email) in enumerate(applicants[:len(applicants) // 2]):
+        if index % 10 == 0:
+            mailbox.add_message(email, 'ieeesb@g.clemson.edu', 'Re: Thank you for your interest in Clemson IEEE!', f'My membership number is {100000000 + index}.\n')
+
+def run_worker(args: argparse.Namespace):
+    '''
+    Runs the benchmark for a single roster size and writes the results to args.result_file.
+    '''
+    applicants = make_applicants(args.size)
+    tigerquest = fakes.FakeTigerQuest(applicants, page_size=args.page_size, latency=args.tigerquest_latency)
+    worksheet = fakes.FakeWorksheet(make_sheet(applicants), latency=args.sheets_latency)
+    mailbox = fakes.FakeGmail(latency=args.gmail_latency)
+    fill_inbox(mailbox, applicants)
+    tigerquest.start()
+
+    # the bot reads auth.toml and the email templates from the current folder when it is imported
+    folder = tempfile.mkdtemp(prefix='tigerquest-benchmark-')
+    with open(os.path.join(folder, 'auth.toml'), 'w') as f:
+        f.write(SETTINGS.format(
+            url=tigerquest.url, backend=args.backend, chromedriver=args.chromedriver,
+            sends_per_second=args.sends_per_second, browser_settings=BROWSER_PROFILES[args.browser_profile]
+        ))
+    shutil.copytree(os.path.join(REPO_FOLDER, 'emails'), os.path.join(folder, 'emails'))
+    os.chdir(folder)
+    sys.path.insert(0, REPO_FOLDER)
+    import sheets
+    import gmail
+    import main as bot
+
+    sheets.worksheet_factory = lambda: worksheet
+    gmail.client_factory = lambda: mailbox
+    if args.fake_browser:
+        bot.browser.driver_factory = fakes.FakeBrowser
+    gmail.reconcile_sent_ledger()
+
+    services = {'tigerquest': tigerquest, 'sheets': worksheet, 'gmail': mailbox}
+    cycles = []
+    for cycle in range(args.cycles):
+        before = {name: service.calls.copy() for name, service in services.items()}
+        problems_before = {name: service.problems.copy() for name, service in services.items()}
+        start = perf_counter()
+        asyncio.run(bot.run_cycle())
+        stage_seconds = perf_counter() - start
+        gmail.wait_for_outbox()
+        summary = bot.metrics.end_cycle()
+        cycles.append({
+            'cycle': cycle + 1,
+            'stage_seconds': round(stage_seconds, 3),
+            'total_seconds': round(perf_counter() - start, 3),
+            'calls': {name: dict(service.calls - before[name]) for name, service in services.items()},
+            'problems': {name: dict(service.problems - problems_before[name]) for name, service in services.items()},
+            'browser_rss_mb': round(bot.browser.memory_mb(), 1),
+            'browser_starts': summary['apis'].get('browser', {}).get('start', {}).get('calls', 0),
+            'latency': summary['apis'],
+        })
+
+    result = {
+        'size': args.size,
+        'backend': args.backend,
+        'browser_profile': 'fake' if args.fake_browser else args.browser_profile,
+        'cycles': cycles,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'approved': len(tigerquest.approved),
+        'denied': len(tigerquest.denied),
+    }
+    bot.browser.close()
+    tigerquest.stop()
+    shutil.rmtree(folder, ignore_errors=True)
+    with open(args.result_file, 'w') as f:
+        json.dump(result, f)
+
+def page_p50(cycle: dict, operation: str) -> float:
+    '''
+    Returns the median latency of a TigerQuest operation during the cycle, or 0 if there were no such calls.
+    '''
+    return cycle['latency'].get('tigerquest', {}).get(operation, {}).get('p50', 0)
+
+def print_result(result: dict):
+    for cycle in result['cycles']:
+        calls = cycle['calls']
+        print(
+            f"{result['size']:>7} {result['backend']:>8} {result['browser_profile']:>8} {cycle['cycle']:>5} {cycle['stage_seconds']:>9.2f} {cycle['total_seconds']:>9.2f} "
+            f"{sum(calls['tigerquest'].values()):>6} {sum(calls['sheets'].values()):>6} {sum(calls['gmail'].values()):>6} "
+            f"{page_p50(cycle, 'roster_page'):>8.3f} {page_p50(cycle, 'profile'):>8.3f} "
+            f"{cycle['browser_starts']:>6} {result['peak_rss_mb']:>9.1f} {cycle['browser_rss_mb']:>11.1f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bot against fake TigerQuest, Sheets, and Gmail services.')
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, help='numbers of applicants to benchmark')
+    parser.add_argument('--backend', choices=['selenium', 'http'], default='selenium', help='TigerQuest scrape backend')
+    parser.add_argument('--cycles', type=int, default=2, help='cycles to run for each size, the first one starts cold')
+    parser.add_argument('--page-size', type=int, default=20, help='applicants per roster page')
+    parser.add_argument('--tigerquest-latency', type=float, default=0.05, help='seconds added to every TigerQuest request')
+    parser.add_argument('--sheets-latency', type=float, default=0.3, help='seconds added to every Sheets call')
+    parser.add_argument('--gmail-latency', type=float, default=0.1, help='seconds added to every Gmail call')
+    parser.add_argument('--sends-per-second', type=float, default=50, help='email send rate limit')
+    parser.add_argument('--browser-profile', choices=list(BROWSER_PROFILES), default='default', help='Chrome launch profile, trimmed is headless and blocks images, fonts and analytics')
+    parser.add_argument('--fake-browser', action='store_true', help='use fakes.FakeBrowser instead of Chrome, only with the http backend')
+    parser.add_argument('--chromedriver', default='', help='path to chromedriver, empty for auto selection')
+    parser.add_argument('--output', help='append the results to this JSONL file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fake_browser and (args.backend != 'http' or args.browser_profile != 'default'):
+        parser.error('--fake-browser only works with --backend http and the default browser profile')
+    if args.worker:
+        run_worker(args)
+        return
+
+    print(
+        f"{'size':>7} {'backend':>8} {'browser':>8} {'cycle':>5} {'stages s':>9} {'total s':>9} {'tq':>6} {'sheets':>6} {'gmail':>6} "
+        f"{'page p50':>8} {'prof p50':>8} {'starts':>6} {'peak MB':>9} {'browser MB':>11}"
+    )
+    for size in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            result_file = f.name
+        command = [
+            sys.executable, os.path.abspath(__file__), '--worker', '--size', str(size), '--result-file', result_file,
+            '--backend', args.backend, '--cycles', str(args.cycles), '--page-size', str(args.page_size),
+            '--tigerquest-latency', str(args.tigerquest_latency), '--sheets-latency', str(args.sheets_latency),
+            '--gmail-latency', str(args.gmail_latency), '--sends-per-second', str(args.sends_per_second),
+            '--chromedriver', args.chromedriver, '--browser-profile', args.browser_profile,
+        ] + (['--fake-browser'] if args.fake_browser else [])
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f'Benchmark for {size} applicants failed:\n{process.stdout[-2000:]}{process.stderr[-2000:]}')
+            continue
+        with open(result_file) as f:
+            result = json.load(f)
+        os.remove(result_file)
+        print_result(result)
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+The functions in this file keep an on-disk cache of TigerQuest member profiles, keyed by the
+profile url from the roster page. A member's name and email do not change while their
+application is pending, so only profiles that have not been seen before (or whose cache entry
+has expired) need to be loaded from TigerQuest.
+'''
+
+from time import time
+from typing import Callable
+from log import logger
+from members import Member
+from settings import settings
+import storage
+import metrics
+
+TTL_SECONDS = settings['TigerQuest'].get('profile_cache_days', 30) * 24 * 60 * 60
+MAX_ENTRIES = settings['TigerQuest'].get('profile_cache_size', 5000)
+
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS profile_cache (
+        href TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )
+''')
+
+def lookup_profiles(hrefs: list[str]) -> dict[str, Member]:
+    '''
+    Returns the cached profiles that have not expired for the given urls, keyed by url.
+    '''
+    now = time()
+    profiles = {}
+    for href in hrefs:
+        rows = storage.execute('SELECT name, email FROM profile_cache WHERE href = ? AND fetched_at > ?', (href, now - TTL_SECONDS))
+        if rows:
+            profiles[href] = Member(rows[0][0], rows[0][1])
+    storage.executemany('UPDATE profile_cache SET last_used = ? WHERE href = ?', [(now, href) for href in profiles])
+    return profiles
+
+def store_profiles(profiles: dict[str, Member]):
+    '''
+    Saves newly loaded profiles, then removes expired entries and the least recently used
+    entries beyond the size limit.
+    '''
+    now = time()
+    storage.executemany(
+        'INSERT OR REPLACE INTO profile_cache (href, name, email, fetched_at, last_used) VALUES (?, ?, ?, ?, ?)',
+        [(href, profile.name, profile.email, now, now) for href, profile in profiles.items()]
+    )
+    storage.execute('DELETE FROM profile_cache WHERE fetched_at <= ?', (now - TTL_SECONDS,))
+    storage.execute('''
+        DELETE FROM profile_cache WHERE href NOT IN (
+            SELECT href FROM profile_cache ORDER BY last_used DESC LIMIT ?
+        )
+    ''', (MAX_ENTRIES,))
+
+def get_profiles(hrefs: list[str], fetch: Callable[[list[str]], list[Member]]) -> list[Member]:
+    '''
+    Returns the profile for each url, in the same order as the urls. Urls that are not in the
+    cache are passed to fetch, which must return their profiles in the same order.
+    '''
+    cached = lookup_profiles(hrefs)
+    missing = [href for href in dict.fromkeys(hrefs) if href not in cached]
+    logger.info(f'Profile cache: {len(cached)} hits, {len(missing)} misses.')
+    metrics.count('profile_cache_hits', len(cached))
+    metrics.count('profile_cache_misses', len(missing))
+
+    fetched = {}
+    if len(missing) > 0:
+        fetched = dict(zip(missing, fetch(missing)))
+        store_profiles(fetched)
+
+    return [cached[href] if href in cached else fetched[href] for href in hrefs]
@@ -0,0 +1,481 @@
+'''
+The classes in this file stand in for TigerQuest, the Google Sheet, and Gmail so that the bot can
+be run end to end without touching the real services, for benchmarking and for trying out
+changes. Each fake counts the calls made to it and can add a delay to every call, enforce a
+per-minute quota, and fail a fraction of calls, to behave more like the real service.
+
+FakeTigerQuest is a real HTTP server on localhost that serves roster and profile pages with the
+same structure as TigerQuest, so both the selenium and the HTTP scrapers can read it. Like the real
+pages, they load images, a web font, and an analytics script.
+FakeBrowser stands in for Chrome by downloading those pages directly, so the HTTP backend can be
+benchmarked on a machine without Chrome.
+FakeWorksheet and FakeGmail are in-process objects with the parts of the gspread and simplegmail
+interfaces the bot uses, and are plugged in through sheets.worksheet_factory and gmail.client_factory.
+'''
+
+import html
+import random
+import re
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import monotonic, sleep
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs, urljoin
+from urllib.request import Request, urlopen
+import httplib2
+from googleapiclient.errors import HttpError
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+class FakeService:
+    '''
+    The behaviour shared by all of the fakes: a delay before every call, a per-minute quota, random
+    failures, and a count of calls by name (and of the calls that were refused, in problems).
+    '''
+    def __init__(self, latency: float = 0, quota_per_minute: int|None = None, failure_rate: float = 0):
+        self.latency = latency
+        self.quota_per_minute = quota_per_minute
+        self.failure_rate = failure_rate
+        self.calls = Counter()
+        self.problems = Counter()
+        self.recent_calls = deque()
+        self.lock = threading.Lock()
+
+    def call(self, name: str) -> str|None:
+        '''
+        Records a call and waits for the simulated latency. Returns 'quota' if the call is over the
+        quota, 'failure' if it was chosen to fail, or None if it should succeed.
+        '''
+        with self.lock:
+            self.calls[name] += 1
+            now = monotonic()
+            while self.recent_calls and self.recent_calls[0] < now - 60:
+                self.recent_calls.popleft()
+            over_quota = self.quota_per_minute is not None and len(self.recent_calls) >= self.quota_per_minute
+            if not over_quota:
+                self.recent_calls.append(now)
+        if self.latency > 0:
+            sleep(self.latency)
+        if over_quota:
+            self.problems['quota'] += 1
+            return 'quota'
+        if self.failure_rate > 0 and random.random() < self.failure_rate:
+            self.problems['failure'] += 1
+            return 'failure'
+        return None
+
+'''TIGERQUEST'''
+# stand-ins for the images, fonts, and analytics scripts that the real TigerQuest pages load
+STATIC_FILES = {
+    'logo.png': ('image/png', b'\x89PNG' + bytes(200_000)),
+    'banner.jpg': ('image/jpeg', bytes(400_000)),
+    'font.woff2': ('font/woff2', bytes(100_000)),
+    'analytics.js': ('text/javascript', b'var analytics = [];' + b' ' * 50_000),
+}
+PAGE_ASSETS = '''<script src="/static/analytics.js"></script>
+<style>@font-face {{ font-family: Fake; src: url('/static/font.woff2'); }} body {{ font-family: Fake; }}</style>'''
+PAGE_IMAGES = '''<img src="/static/logo.png"><img src="/static/banner.jpg">'''
+
+ROSTER_PAGE = '''<html><head>''' + PAGE_ASSETS + '''<script>
+function runAction(url) {{
+    var request = new XMLHttpRequest();
+    request.open('POST', url);
+    request.onload = function() {{
+        var id = url.split('/').pop();
+        var row = document.querySelector("input[value='" + id + "']").closest('tr');
+        row.parentNode.removeChild(row);
+    }};
+    request.send();
+}}
+function ApproveMember(url) {{ runAction(url); }}
+function DenyMember(url) {{ runAction(url); }}
+</script></head><body>''' + PAGE_IMAGES + '''
+<div class="svgGrid"><table>
+{rows}
+</table></div>
+<span class="paginationRight">{next_link}</span>
+</body></html>'''
+ROSTER_ROW = '''<tr><td><input type="checkbox" value="{id}" title="{name}"></td><td><a class="member-modal" href="/profile/{id}">{name}</a></td></tr>'''
+PROFILE_PAGE = '''<html><head>''' + PAGE_ASSETS + '''</head><body>''' + PAGE_IMAGES + '''<div class="userCard-section">
+<span class="fn">{name}</span>
+<a class="email" href="mailto:{email}">{email}</a>
+</div></body></html>'''
+
+class FakeTigerQuest(FakeService):
+    '''
+    Serves a roster of prospective members on localhost. applicants is a list of (id, name, email).
+    The roster is at /roster, profiles are at /profile/<id>, and posting to /approve/<id> or
+    /deny/<id> removes the applicant from the roster.
+    '''
+    def __init__(self, applicants: list[tuple[str, str, str]], page_size: int = 20, **kwargs):
+        super().__init__(**kwargs)
+        self.applicants = {id: (name, email) for id, name, email in applicants}
+        self.page_size = page_size
+        self.approved = []
+        self.denied = []
+
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.handle(self)
+
+            def do_POST(self):
+                fake.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='FakeTigerQuest', daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        url = urlparse(request.path)
+        parts = url.path.strip('/').split('/')
+        problem = self.call(parts[0])
+        if problem == 'quota':
+            return self.respond(request, 429, 'Too many requests')
+        if problem == 'failure':
+            return self.respond(request, 503, 'Service unavailable')
+
+        if parts[0] == 'static' and len(parts) == 2 and parts[1] in STATIC_FILES:
+            content_type, data = STATIC_FILES[parts[1]]
+            return self.respond(request, 200, data, content_type)
+        if parts[0] == 'roster':
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            return self.respond(request, 200, self.roster_page(page))
+        if parts[0] == 'profile' and len(parts) == 2 and parts[1] in self.applicants:
+            name, email = self.applicants[parts[1]]
+            return self.respond(request, 200, PROFILE_PAGE.format(name=html.escape(name), email=html.escape(email)))
+        if parts[0] in ('approve', 'deny') and len(parts) == 2:
+            with self.lock:
+                if self.applicants.pop(parts[1], None) is not None:
+                    (self.approved if parts[0] == 'approve' else self.denied).append(parts[1])
+            return self.respond(request, 200, 'OK')
+        return self.respond(request, 404, 'Not found')
+
+    def roster_page(self, page: int) -> str:
+        with self.lock:
+            applicants = list(self.applicants.items())
+        page_applicants = applicants[(page - 1) * self.page_size:page * self.page_size]
+        rows = '\n'.join(ROSTER_ROW.format(id=id, name=html.escape(name)) for id, (name, email) in page_applicants)
+        next_link = f'<a href="/roster?page={page + 1}">next</a>' if page * self.page_size < len(applicants) else ''
+        return ROSTER_PAGE.format(rows=rows, next_link=next_link)
+
+    def respond(self, request: BaseHTTPRequestHandler, status: int, body: str|bytes, content_type: str = 'text/html; charset=utf-8'):
+        data = body.encode() if isinstance(body, str) else body
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+class FakeElement:
+    '''
+    An element found by FakeBrowser, with its attributes. Everything it finds is shown on the page.
+    '''
+    def __init__(self, attributes: dict[str, str]):
+        self.attributes = attributes
+
+    def get_attribute(self, name: str) -> str|None:
+        return self.attributes.get(name)
+
+    def is_displayed(self) -> bool:
+        return True
+
+# the XPath webscraper.iter_roster_pages uses to find the link to the next roster page
+NEXT_PAGE_XPATH = "//span[@class='paginationRight']//a[text()='next']"
+
+class FakeBrowser(FakeService):
+    '''
+    Just enough of a selenium Chrome driver for the bot to use the pages served by FakeTigerQuest
+    without starting Chrome, for use with the HTTP scrape backend. Pages are downloaded without
+    their images, fonts, and scripts, and the only elements it can find are the member list (by its
+    class name), the checkboxes on the roster (by a value or title CSS selector), and the next page link.
+    ApproveMember and DenyMember are run by posting to the url and reloading the page.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.current_url = 'about:blank'
+        self.page_source = ''
+        self.window_handles = ['main']
+        self.switch_to = SimpleNamespace(window=lambda handle: None)
+        self.service = SimpleNamespace(process=None)
+
+    def get(self, url: str):
+        self.call('get')
+        with urlopen(url, timeout=30) as response:
+            self.current_url = response.url
+            self.page_source = response.read().decode()
+
+    def execute_script(self, script: str):
+        if 'navigator.userAgent' in script:
+            return 'FakeBrowser'
+        if 'document.readyState' in script:
+            return True if '===' in script else 'complete'
+        action = re.search(r"(?:ApproveMember|DenyMember)\('([^']+)'\)", script)
+        if action is not None:
+            self.call('post')
+            urlopen(Request(action.group(1), method='POST'), timeout=30).close()
+            # the page's script removes the member's row, so load the page again to get the same result
+            self.get(self.current_url)
+            return None
+        raise NotImplementedError(f'FakeBrowser cannot run {script}')
+
+    def find_elements(self, by: str, value: str) -> list[FakeElement]:
+        if by == By.CLASS_NAME:
+            return [FakeElement({}) for match in re.finditer(rf'class="[^"]*\b{re.escape(value)}\b', self.page_source)]
+        if by == By.XPATH and value == NEXT_PAGE_XPATH:
+            return [FakeElement({'href': urljoin(self.current_url, html.unescape(match.group(1)))}) for match in re.finditer(r'<span class="paginationRight"><a href="([^"]*)">next</a>', self.page_source)]
+        selector = re.fullmatch(r"input\[(value|title)='(.*)'\]", value)
+        if by != By.CSS_SELECTOR or selector is None:
+            raise NotImplementedError(f'FakeBrowser cannot find elements by {by} {value}')
+        inputs = [
+            {name: html.unescape(attribute) for name, attribute in re.findall(r'(\w+)="([^"]*)"', match.group(0))}
+            for match in re.finditer(r'<input[^>]*>', self.page_source)
+        ]
+        return [FakeElement(attributes) for attributes in inputs if attributes.get(selector.group(1)) == selector.group(2)]
+
+    def find_element(self, by: str, value: str) -> FakeElement:
+        elements = self.find_elements(by, value)
+        if len(elements) == 0:
+            raise NoSuchElementException(f'No element found by {by} {value}')
+        return elements[0]
+
+    def get_cookies(self) -> list[dict]:
+        return []
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+'''GOOGLE SHEETS'''
+class FakeAPIResponse:
+    '''
+    Just enough of a requests response for gspread to build an APIError from.
+    '''
+    def __init__(self, code: int, message: str):
+        self.status_code = code
+        self.text = message
+        self.error = {'code': code, 'message': message, 'status': 'RESOURCE_EXHAUSTED' if code == 429 else 'UNAVAILABLE'}
+
+    def json(self) -> dict:
+        return {'error': self.error}
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet: 'FakeWorksheet'):
+        self.worksheet = worksheet
+
+    def batch_update(self, body: dict):
+        self.worksheet.check('spreadsheet.batch_update')
+        with self.worksheet.lock:
+            for request in body['requests']:
+                span = request['deleteDimension']['range']
+                del self.worksheet.values[span['startIndex']:span['endIndex']]
+
+class FakeWorksheet(FakeService):
+    '''
+    A sheet held in memory as a list of rows, with the gspread worksheet methods used by sheets.py.
+    Reads and writes share one per-minute quota, like the Sheets API's per-user limit.
+    '''
+    def __init__(self, values: list[list[str]], latency: float = 0.3, quota_per_minute: int|None = 60, failure_rate: float = 0):
+        super().__init__(latency, quota_per_minute, failure_rate)
+        self.values = [list(row) for row in values]
+        self.id = 0
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def check(self, name: str):
+        problem = self.call(name)
+        if problem == 'quota':
+            raise APIError(FakeAPIResponse(429, 'Quota exceeded for quota metric Read requests per minute per user.'))
+        if problem == 'failure':
+            raise APIError(FakeAPIResponse(503, 'The service is currently unavailable.'))
+
+    def cell(self, row: int, column: int) -> str:
+        if row - 1 < len(self.values) and column - 1 < len(self.values[row - 1]):
+            return self.values[row - 1][column - 1]
+        return ''
+
+    def get_values(self, range_name: str) -> list[list[str]]:
+        self.check('get_values')
+        with self.lock:
+            return [list(row) for row in self.values]
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        self.check('batch_get')
+        found = []
+        with self.lock:
+            for range_name in ranges:
+                value = self.cell(*a1_to_rowcol(range_name))
+                found.append([[value]] if value != '' else [])
+        return found
+
+    def batch_update(self, updates: list[dict], value_input_option: str = 'RAW'):
+        self.check('batch_update')
+        with self.lock:
+            for update in updates:
+                row, column = a1_to_rowcol(update['range'])
+                while len(self.values) < row:
+                    self.values.append([])
+                cells = self.values[row - 1]
+                cells.extend([''] * (column - len(cells)))
+                cells[column - 1] = str(update['values'][0][0])
+
+    def append_rows(self, rows: list[list[str]], table_range: str|None = None, **kwargs):
+        self.check('append_rows')
+        with self.lock:
+            while self.values and not any(self.values[-1]):
+                self.values.pop()
+            self.values.extend([str(value) for value in row] for row in rows)
+
+'''GMAIL'''
+class FakeMessage:
+    '''
+    The attributes of a simplegmail message that the bot reads.
+    '''
+    def __init__(self, id: str, sender: str, recipient: str, subject: str, plain: str, date: datetime, label: str):
+        self.id = id
+        self.sender = sender
+        self.recipient = recipient
+        self.subject = subject
+        self.plain = plain
+        self.date = str(date)
+        self.timestamp = date.timestamp()
+        self.label = label
+
+class FakeRequest:
+    '''
+    A Gmail API request, which is only run when execute is called.
+    '''
+    def __init__(self, gmail: 'FakeGmail', name: str, function):
+        self.gmail = gmail
+        self.name = name
+        self.function = function
+
+    def execute(self):
+        self.gmail.check(self.name)
+        return self.function()
+
+class FakeGmailService:
+    '''
+    The parts of the Gmail API client (gmail.service) that the bot calls directly.
+    '''
+    PAGE_SIZE = 100
+
+    def __init__(self, gmail: 'FakeGmail'):
+        self.gmail = gmail
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return FakeGmailHistory(self.gmail)
+
+    def list(self, userId: str, q: str = '', pageToken: str|None = None):
+        def run():
+            matches = self.gmail.search(q)
+            start = int(pageToken or 0)
+            response = {'messages': [{'id': message.id} for message in matches[start:start + self.PAGE_SIZE]]}
+            if start + self.PAGE_SIZE < len(matches):
+                response['nextPageToken'] = str(start + self.PAGE_SIZE)
+            return response
+        return FakeRequest(self.gmail, 'messages.list', run)
+
+    def getProfile(self, userId: str):
+        return FakeRequest(self.gmail, 'getProfile', lambda: {'historyId': str(self.gmail.history_id)})
+
+class FakeGmailHistory:
+    def __init__(self, gmail: 'FakeGmail'):
+        self.gmail = gmail
+
+    def list(self, userId: str, startHistoryId: str, historyTypes: str = '', labelId: str = ''):
+        def run():
+            with self.gmail.lock:
+                added = [message for history_id, message in self.gmail.history if history_id > int(startHistoryId) and message.label == (labelId or message.label)]
+                return {'historyId': str(self.gmail.history_id), 'history': [{'messagesAdded': [{'message': {'id': message.id}}]} for message in added]}
+        return FakeRequest(self.gmail, 'history.list', run)
+
+class FakeGmail(FakeService):
+    '''
+    A mailbox held in memory, with the simplegmail methods used by gmail.py. Every pooled client
+    shares the same mailbox, so gmail.client_factory can return the same FakeGmail each time.
+    '''
+    def __init__(self, latency: float = 0.1, quota_per_minute: int|None = 15000, failure_rate: float = 0):
+        super().__init__(latency, quota_per_minute, failure_rate)
+        self.messages = {}
+        self.history = [] # (history id, message) for every message added
+        self.history_id = 1
+        self.service = FakeGmailService(self)
+
+    def check(self, name: str):
+        problem = self.call(name)
+        if problem is not None:
+            status = 429 if problem == 'quota' else 503
+            raise HttpError(httplib2.Response({'status': status}), f'Fake Gmail {problem}'.encode())
+
+    def add_message(self, sender: str, recipient: str, subject: str, plain: str, date: datetime|None = None, label: str = 'INBOX') -> FakeMessage:
+        '''
+        Puts a message in the mailbox, in the inbox unless label is 'SENT'.
+        '''
+        with self.lock:
+            self.history_id += 1
+            message = FakeMessage(f'm{self.history_id}', sender, recipient, subject, plain, date or datetime.now().astimezone(), label)
+            self.messages[message.id] = message
+            self.history.append((self.history_id, message))
+        return message
+
+    def search(self, query: str) -> list[FakeMessage]:
+        '''
+        Returns the messages matching the query, newest first. Only the search terms used by the
+        bot are understood: from:, to:, after:, in:inbox, in:sent, and -in:sent. Like Gmail, a query
+        without in: searches every message.
+        '''
+        label = re.search(r'(-?)in:(\w+)', query)
+        excluded = label is not None and label.group(1) == '-'
+        label = label.group(2).upper() if label else None
+        senders = {address.lower() for address in re.findall(r'from:([^\s{}()]+)', query)}
+        recipients = {address.lower() for address in re.findall(r'to:([^\s{}()]+)', query)}
+        after = re.search(r'after:(\d+)', query)
+        with self.lock:
+            messages = list(self.messages.values())
+        matches = [
+            message for message in messages
+            if (label is None or (message.label != label if excluded else message.label == label))
+            and (not senders or message.sender.lower() in senders)
+            and (not recipients or message.recipient.lower() in recipients)
+            and (after is None or message.timestamp > int(after.group(1)))
+        ]
+        return sorted(matches, key=lambda message: message.timestamp, reverse=True)
+
+    def _build_message_from_ref(self, user_id: str, message_ref: dict) -> FakeMessage:
+        self.check('messages.get')
+        return self.messages[message_ref['id']]
+
+    def get_messages(self, query: str = '', **kwargs) -> list[FakeMessage]:
+        self.check('messages.list')
+        matches = self.search(query)
+        for message in matches:
+            self.check('messages.get')
+        return matches
+
+    def send_message(self, sender: str, to: str, subject: str = '', msg_html: str|None = None, msg_plain: str|None = None, **kwargs) -> FakeMessage:
+        self.check('messages.send')
+        return self.add_message(sender, to, subject, msg_plain or msg_html or '', label='SENT')
@@ -7,162 +7,313 @@ membership status updates.
 from simplegmail import Gmail
 from simplegmail.message import Message
 from simplegmail.query import construct_query
+from time import perf_counter, time, sleep
+from datetime import datetime
+from email.utils import parseaddr, getaddresses
+import threading
+import queue
 import re
+from contextlib import contextmanager
 from log import logger
 from settings import settings
+import storage
+import templates
+import metrics
+from members import Member, normalize_email
+from outbox import Outbox
+from googleapiclient.errors import HttpError
+
+gmail_settings = settings['Gmail']
+# at most this many Gmail clients are built, enough for every outbox worker plus the stages and the ledger thread
+POOL_SIZE = gmail_settings.get('client_pool_size', gmail_settings.get('send_workers', 4) + 2)
+# Gmail clients that are not in use, shared by every thread. The http connection inside a client is not
+# thread safe, so each client is only used by the thread that checked it out until it is returned.
+idle_clients = queue.Queue()
+# held while a client is being built, so threads do not overwrite each other's token file
+client_lock = threading.Lock()
+client_stats = {
+    'built': 0,
+    'reused': 0,
+    'build_seconds': 0.0,
+}
+
+def build_client() -> Gmail:
+    '''
+    Builds a Gmail object using the credentials in credentials.json.
+    '''
+    return Gmail(client_secret_file='credentials.json')
+
+# called to build each pooled Gmail object, can be replaced with anything that behaves like one (such as fakes.FakeGmail)
+client_factory = build_client
 
-def get_gmail() -> Gmail:
+def checkout_client() -> Gmail:
     '''
-    Initializes gmail object.
+    Takes an idle Gmail object from the pool. A new one is only built when none are idle and fewer
+    than POOL_SIZE have been built, otherwise this waits for one to be returned.
     '''
-    gmail = Gmail(client_secret_file='credentials.json')
+    try:
+        gmail = idle_clients.get_nowait()
+    except queue.Empty:
+        with client_lock:
+            if client_stats['built'] < POOL_SIZE:
+                start = perf_counter()
+                with metrics.timer('gmail', 'build_client'):
+                    gmail = client_factory()
+                client_stats['built'] += 1
+                client_stats['build_seconds'] += perf_counter() - start
+                return gmail
+        gmail = idle_clients.get()
+
+    with client_lock:
+        client_stats['reused'] += 1
     return gmail
 
-def format_email(email_str: str, member: dict[str, str]) -> str:
+@contextmanager
+def get_gmail():
     '''
-    Takes the HTML for the email and replaces the placeholder text with the member's name and president's name.
+    Checks out a Gmail object from the pool for the length of the with block, then returns it.
+    simplegmail refreshes the access token itself before each call when it has expired.
+
+    A with block should not call anything else that checks out a client, or every client could end
+    up held by a thread waiting for another one.
     '''
-    email_str = email_str.replace("%FIRST_NAME%", member['name'].split(' ')[0])
-    
-    # get president's name from settings and replace in email
-    president_name = settings['Gmail']['president_name']
-    email_str = email_str.replace("%PRESIDENT_NAME%", president_name)
-    return email_str
+    gmail = checkout_client()
+    try:
+        yield gmail
+    finally:
+        idle_clients.put(gmail)
 
-def get_email(email_name: str) -> str:
-    with open(f'emails/{email_name}.html', 'r') as f:
-        email_str = f.read()
-        return email_str
+def log_client_stats():
+    '''
+    Logs how many Gmail objects have been built and roughly how much time reusing them has saved.
+    '''
+    if client_stats['built'] == 0:
+        return
+    average = client_stats['build_seconds'] / client_stats['built']
+    logger.info(f"Gmail clients: {client_stats['built']} built (average {average:.2f}s each), {client_stats['reused']} reuses saved about {average * client_stats['reused']:.1f}s.")
+
+def get_member_values(member: Member) -> dict[str, str]:
+    '''
+    Returns the placeholder values used to fill in an email template for the member.
+    '''
+    return {
+        'FIRST_NAME': member.first_name,
+        'PRESIDENT_NAME': settings['Gmail']['president_name'],
+    }
 
-def get_last_email(member: dict[str, str]) -> Message|None:
+def get_last_email(member: Member) -> Message|None:
     '''
     Returns the last email sent to a member.
     '''
-    gmail = get_gmail()
     query = construct_query({
         'sender': ['ieeesb@g.clemson.edu'],
-        'recipient': [member['email'], swap_email_ending(member['email'])],
+        'recipient': [member.email, swap_email_ending(member.email)],
         'newer_than': (1, "month"), # prevent weird issues from happening over breaks or something
     })
-    emails = gmail.get_messages(query=query)
+    with get_gmail() as gmail, metrics.timer('gmail', 'search'):
+        emails = gmail.get_messages(query=query)
     if emails and len(emails) > 0:
         return emails[0]
     else:
         return None
 
-def verify_not_duplicate(member: dict[str, str], params: dict[str, str]):
+# every email the bot sends is added to this table, so duplicates can be caught without searching the sent folder
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS sent_emails (
+        message_id TEXT,
+        recipient TEXT NOT NULL,
+        template TEXT,
+        subject TEXT NOT NULL,
+        sent_at TEXT NOT NULL,
+        UNIQUE (message_id, recipient)
+    )
+''')
+LEDGER_RECONCILE_HOURS = settings['Gmail'].get('ledger_reconcile_hours', 6)
+
+# normalized recipient -> (time sent, subject) of the newest email sent to them
+last_sent = {}
+# held while last_sent is being updated, since the reconciliation thread also writes to it
+ledger_lock = threading.Lock()
+
+def remember_sent_email(recipient: str, subject: str, sent_at: datetime):
+    '''
+    Updates the newest email sent to the recipient if this one is newer.
+    '''
+    key = normalize_email(recipient)
+    with ledger_lock:
+        current = last_sent.get(key)
+        if current is None or sent_at >= current[0]:
+            last_sent[key] = (sent_at, subject)
+
+for recipient, subject, sent_at in storage.execute('SELECT recipient, subject, sent_at FROM sent_emails'):
+    remember_sent_email(recipient, subject, datetime.fromisoformat(sent_at))
+
+def record_sent_email(recipient: str, template: str, subject: str, message: Message|None):
+    '''
+    Adds an email that was just sent to the sent email ledger.
+    '''
+    sent_at = datetime.now().astimezone()
+    message_id = message.id if message is not None else None
+    storage.execute(
+        'INSERT OR IGNORE INTO sent_emails (message_id, recipient, template, subject, sent_at) VALUES (?, ?, ?, ?, ?)',
+        (message_id, recipient, template, subject, str(sent_at))
+    )
+    remember_sent_email(recipient, subject, sent_at)
+
+def ledger_is_reconciled() -> bool:
+    '''
+    Returns True once the ledger has been checked against the sent folder at least once, after which
+    it can be trusted to contain every recent email.
+    '''
+    return storage.get_value('sent_ledger_reconciled_at') is not None
+
+def reconcile_sent_ledger():
+    '''
+    Adds any email in the sent folder from the last month that is missing from the ledger, such as
+    emails sent by hand or sent before the ledger existed.
+    '''
+    with get_gmail() as gmail:
+        message_ids = list_message_ids(gmail, 'in:sent newer_than:1m')
+    known = {row[0] for row in storage.execute('SELECT DISTINCT message_id FROM sent_emails WHERE message_id IS NOT NULL')}
+    missing = [message_id for message_id in message_ids if message_id not in known]
+    for message_id in missing:
+        # simplegmail has no public way to download a single message by id
+        with get_gmail() as gmail, metrics.timer('gmail', 'messages.get'):
+            message = gmail._build_message_from_ref('me', {'id': message_id})
+        try:
+            sent_at = datetime.fromisoformat(message.date)
+        except (TypeError, ValueError):
+            sent_at = datetime.now().astimezone()
+        for _, recipient in getaddresses([message.recipient or '']):
+            if recipient:
+                storage.execute(
+                    'INSERT OR IGNORE INTO sent_emails (message_id, recipient, template, subject, sent_at) VALUES (?, ?, NULL, ?, ?)',
+                    (message_id, recipient, message.subject or '', str(sent_at))
+                )
+                remember_sent_email(recipient, message.subject or '', sent_at)
+    storage.set_value('sent_ledger_reconciled_at', str(time()))
+    logger.debug(f'Reconciled sent email ledger, added {len(missing)} messages from the sent folder.')
+
+def start_ledger_reconciliation():
+    '''
+    Starts a background thread that reconciles the sent email ledger now and then every ledger_reconcile_hours.
+    '''
+    def reconcile_forever():
+        # after a restart, wait out the rest of the interval if the ledger was reconciled recently
+        reconciled_at = storage.get_value('sent_ledger_reconciled_at')
+        if reconciled_at is not None:
+            sleep(max(0, float(reconciled_at) + LEDGER_RECONCILE_HOURS * 60 * 60 - time()))
+        while True:
+            try:
+                reconcile_sent_ledger()
+            except Exception:
+                logger.exception('Failed to reconcile the sent email ledger.')
+            sleep(LEDGER_RECONCILE_HOURS * 60 * 60)
+
+    threading.Thread(target=reconcile_forever, name='LedgerReconciliation', daemon=True).start()
+
+def verify_not_duplicate(member: Member, params: dict[str, str]):
     '''
     Checks the subject line of the current email being sent and the last email sent to the member.
     If they match, returns False to indiciate that the email should not be sent.
     If they do not match, returns True to indicate that the email can be sent.
     '''
-    # get the last email sent to the member
-    last_email = get_last_email(member)
-    if last_email is not None:
-        # if the last email sent to the member does has the same subject line as the current email, return False
-        if last_email.subject == params['subject']:
-            logger.debug(f"Prevented duplicate email with subject line '{params['subject']}' from being sent to {member['name']} at '{member['email']}'.")
-            send_critical_email(f"Prevented duplicate email with subject line '{params['subject']}' from being sent to {member['name']} at '{member['email']}'.")
-            return False
-    # if no emails have been sent in the last month, or the if statement above did not return False, return True
+    # get the subject of the last email sent to the member, from the ledger if it has been reconciled
+    if ledger_is_reconciled():
+        with ledger_lock:
+            last = last_sent.get(member.key)
+        last_subject = last[1] if last is not None else None
+    else:
+        last_email = get_last_email(member)
+        last_subject = last_email.subject if last_email is not None else None
+
+    # if the last email sent to the member does has the same subject line as the current email, return False
+    if last_subject == params['subject']:
+        logger.debug(f"Prevented duplicate email with subject line '{params['subject']}' from being sent to {member.name} at '{member.email}'.")
+        send_critical_email(f"Prevented duplicate email with subject line '{params['subject']}' from being sent to {member.name} at '{member.email}'.")
+        return False
+    # if no emails have been sent to the member, or the if statement above did not return False, return True
     return True
 
-def send_interest_email(member: dict[str, str]):
+EMAIL_SUBJECTS = {
+    'interest': 'Thank you for your interest in Clemson IEEE!',
+    'reminder': 'Clemson IEEE: Please Complete Registration Within One Week',
+    'welcome': 'Welcome to IEEE!',
+    'rejection': 'Clemson IEEE Student Branch: Your application has been rejected due to lack of information',
+}
+
+def deliver_member_email(payload: dict):
     '''
-    Sends an email to a new member.
+    Sends one of the member emails. Called by the outbox workers with a payload containing the
+    'member' (from Member.to_dict) and the name of the email 'template' to send them.
     '''
+    member = Member.from_dict(payload['member'])
+    template = payload['template']
 
-    # load interest form
-    email_html = get_email('interest')
-    email_html = format_email(email_html, member)
+    # fill in the email with the member's details
+    email_html = templates.render(template, get_member_values(member))
 
     # send email to user
-    gmail = get_gmail()
     params = {
-        'to': member['email'],
+        'to': member.email,
         'sender': 'ieeesb@g.clemson.edu',
-        'subject': 'Thank you for your interest in Clemson IEEE!',
+        'subject': EMAIL_SUBJECTS[template],
         'msg_html': email_html,
         'signature': True,
     }
 
     if verify_not_duplicate(member, params):
         if settings.get('Debug') != True:
-            gmail.send_message(**params)
-
-        logger.debug(f'Interest email sent to {member["name"]}')
-
-def send_reminder_email(member: dict[str, str]):
+            with get_gmail() as gmail, metrics.timer('gmail', 'send'):
+                message = gmail.send_message(**params)
+            record_sent_email(member.email, template, params['subject'], message)
+
+        logger.debug(f'{template.capitalize()} email sent to {member.name}')
+
+outbox = Outbox(
+    {'member_email': deliver_member_email},
+    workers=gmail_settings.get('send_workers', 4),
+    rate=gmail_settings.get('sends_per_second', 2),
+    burst=gmail_settings.get('send_burst', 5),
+    max_attempts=gmail_settings.get('send_attempts', 5),
+    retry_seconds=gmail_settings.get('send_retry_minutes', 5) * 60,
+)
+
+def start_outbox():
     '''
-    Sends a reminder email to a member.
+    Starts sending emails, including any left over from before the last restart.
     '''
-    # load interest form
-    email_html = get_email('reminder')
-    email_html = format_email(email_html, member)
-
-    # send email to user
-    gmail = get_gmail()
-    params = {
-        'to': member['email'],
-        'sender': 'ieeesb@g.clemson.edu',
-        'subject': 'Clemson IEEE: Please Complete Registration Within One Week',
-        'msg_html': email_html,
-        'signature': True,
-    }
-
-    if verify_not_duplicate(member, params):
-        if settings.get('Debug') != True:
-            gmail.send_message(**params)
-
-        logger.debug(f'Reminder email sent to {member["name"]}')
+    outbox.start()
 
-def send_welcome_email(member: dict[str, str]):
+def send_interest_email(member: Member):
     '''
-    Sends a welcome email to a member.
+    Queues an email to a new member.
     '''
-    # load interest form
-    email_html = get_email('welcome')
-    email_html = format_email(email_html, member)
+    outbox.enqueue('member_email', {'member': member.to_dict(), 'template': 'interest'})
 
-    # send email to user
-    gmail = get_gmail()
-    params = {
-        'to': member['email'],
-        'sender': 'ieeesb@g.clemson.edu',
-        'subject': 'Welcome to IEEE!',
-        'msg_html': email_html,
-        'signature': True,
-    }
-
-    if verify_not_duplicate(member, params):
-        if settings.get('Debug') != True:
-            gmail.send_message(**params)
-
-        logger.debug(f'Welcome email sent to {member["name"]}')
-
-def send_rejection_email(member: dict[str, str]):
+def send_reminder_email(member: Member):
     '''
-    Sends a welcome email to a member.
+    Queues a reminder email to a member.
     '''
-    # load interest form
-    email_html = get_email('rejection')
-    email_html = format_email(email_html, member)
+    outbox.enqueue('member_email', {'member': member.to_dict(), 'template': 'reminder'})
 
-    # send email to user
-    gmail = get_gmail()
-    params = {
-        'to': member['email'],
-        'sender': 'ieeesb@g.clemson.edu',
-        'subject': 'Clemson IEEE Student Branch: Your application has been rejected due to lack of information',
-        'msg_html': email_html,
-        'signature': True,
-    }
+def send_welcome_email(member: Member):
+    '''
+    Queues a welcome email to a member.
+    '''
+    outbox.enqueue('member_email', {'member': member.to_dict(), 'template': 'welcome'})
 
-    if verify_not_duplicate(member, params):
-        if settings.get('Debug') != True:
-            gmail.send_message(**params)
+def send_rejection_email(member: Member):
+    '''
+    Queues a rejection email to a member.
+    '''
+    outbox.enqueue('member_email', {'member': member.to_dict(), 'template': 'rejection'})
 
-        logger.debug(f'Rejection email sent to {member["name"]}')
+def wait_for_outbox():
+    '''
+    Blocks until every queued email has been sent (or has failed and is waiting to be retried).
+    '''
+    outbox.wait()
 
 def swap_email_ending(email):
     '''
@@ -196,24 +347,152 @@ def find_membership_number(email: str) -> str:
         return match.group(1)
     return None
 
-def get_membership_id_from_email(member: dict[str, str]) -> str:
+SCAN_OVERLAP_SECONDS = 10 * 60 # rescan a few minutes before the checkpoint so delayed messages are not missed
+SENDERS_PER_QUERY = 40
+
+# every inbound message is only downloaded and searched for a membership number once, the result is saved here
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS processed_messages (
+        message_id TEXT PRIMARY KEY,
+        sender TEXT NOT NULL,
+        membership_number TEXT
+    )
+''')
+storage.execute('CREATE TABLE IF NOT EXISTS scanned_senders (address TEXT PRIMARY KEY)')
+
+# sender address -> newest membership number found in their emails, rebuilt from the saved messages on startup
+membership_ids_by_sender = {}
+for sender, membership_number in storage.execute('SELECT sender, membership_number FROM processed_messages WHERE membership_number IS NOT NULL ORDER BY rowid'):
+    membership_ids_by_sender[sender] = membership_number
+# sender addresses whose whole history has already been searched
+scanned_senders = {row[0] for row in storage.execute('SELECT address FROM scanned_senders')}
+
+def get_sender_email(message: Message) -> str:
     '''
-    Takes a member and returns their membership ID from the email.
+    Returns just the address part of a message's sender, in lower case.
     '''
-    query = construct_query({
-        'sender': [member['email'], swap_email_ending(member['email'])],
-    })
+    return parseaddr(message.sender)[1].lower()
 
-    gmail = get_gmail()
-    messages = gmail.get_messages(query=query)
+def list_message_ids(gmail: Gmail, query: str) -> list[str]:
+    '''
+    Returns the ids of every message matching the query, newest first, without downloading the messages.
+    '''
+    message_ids = []
+    page_token = None
+    while True:
+        with metrics.timer('gmail', 'messages.list'):
+            response = gmail.service.users().messages().list(userId='me', q=query, pageToken=page_token).execute()
+        message_ids.extend(ref['id'] for ref in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return message_ids
+
+def process_messages(gmail: Gmail, query: str):
+    '''
+    Downloads every message matching the query that has not been processed before, saves the
+    membership number found in it (or that none was found), and adds it to the sender index.
+    Messages are handled oldest first so that a sender's newest number wins. Returns the number of new messages.
+    '''
+    message_ids = list_message_ids(gmail, query)
+    processed = set()
+    for start in range(0, len(message_ids), 500):
+        chunk = message_ids[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        processed.update(row[0] for row in storage.execute(f'SELECT message_id FROM processed_messages WHERE message_id IN ({placeholders})', tuple(chunk)))
+
+    new_message_ids = [message_id for message_id in message_ids if message_id not in processed]
+    logger.debug(f'Query {query} matched {len(message_ids)} messages, {len(new_message_ids)} not processed before.')
+    for message_id in reversed(new_message_ids):
+        # simplegmail has no public way to download a single message by id
+        with metrics.timer('gmail', 'messages.get'):
+            message = gmail._build_message_from_ref('me', {'id': message_id})
+        sender = get_sender_email(message)
+        membership_number = find_membership_number(message.plain)
+        storage.execute('INSERT OR REPLACE INTO processed_messages (message_id, sender, membership_number) VALUES (?, ?, ?)', (message_id, sender, membership_number))
+        if membership_number:
+            membership_ids_by_sender[sender] = membership_number
+    return len(new_message_ids)
+
+def scan_new_messages() -> bool:
+    '''
+    Processes every message received since the last scan and moves the checkpoint forward. This does
+    not depend on which members are pending, so it can run while the roster is still being read.
+    Returns True if there were new messages.
+    '''
+    scan_start = time()
+
+    # the checkpoint is saved, so after a restart the scan carries on from where it left off
+    last_scan_time = storage.get_value('inbox_last_scan_time')
+    new_messages = 0
+    if last_scan_time is not None:
+        # everything but the sent folder, or every email the bot sent since the last scan would be downloaded
+        # again. Replies that were archived or filtered out of the inbox before this scan are still found.
+        with get_gmail() as gmail:
+            new_messages = process_messages(gmail, f'-in:sent after:{int(float(last_scan_time)) - SCAN_OVERLAP_SECONDS}')
+    storage.set_value('inbox_last_scan_time', str(scan_start))
+    return new_messages > 0
+
+def get_membership_ids(members: list[Member], scan_new: bool = True) -> dict[str, str]:
+    '''
+    Returns a dictionary of member key (normalized email) -> membership number for every member who has emailed one in,
+    using at most a few inbox searches per loop instead of one search per member.
 
-    # search all emails for the membership number
-    # if the membership number is found, return it
-    # if not, return None
-    for message in messages:
-        if find_membership_number(message.plain):
-            return find_membership_number(message.plain)
-    return None
+    Messages received since the last scan are searched once for all senders, unless scan_new is False
+    because scan_new_messages has just been called. Members that have not been looked up before have
+    their full history searched, many senders per query.
+    '''
+    if scan_new:
+        scan_new_messages()
+
+    new_senders = []
+    for member in members:
+        for address in (member.email.lower(), swap_email_ending(member.email).lower()):
+            if address not in scanned_senders and address not in new_senders:
+                new_senders.append(address)
+    for start in range(0, len(new_senders), SENDERS_PER_QUERY):
+        query = construct_query({
+            'sender': new_senders[start:start + SENDERS_PER_QUERY],
+        })
+        with get_gmail() as gmail:
+            process_messages(gmail, query)
+    storage.executemany('INSERT OR IGNORE INTO scanned_senders (address) VALUES (?)', [(address,) for address in new_senders])
+    scanned_senders.update(new_senders)
+
+    membership_ids = {}
+    for member in members:
+        for address in (member.email.lower(), swap_email_ending(member.email).lower()):
+            if address in membership_ids_by_sender:
+                membership_ids[member.key] = membership_ids_by_sender[address]
+                break
+    logger.info(f'Found membership numbers for {len(membership_ids)} of {len(members)} pending members.')
+    return membership_ids
+
+# history id of the mailbox the last time it was checked for new messages
+last_history_id = None
+
+def has_new_messages() -> bool:
+    '''
+    Returns True if a message has arrived in the inbox since the last time this was called. This
+    only reads the mailbox history, which is much cheaper than searching the inbox, and emails sent
+    by the bot are not counted.
+    '''
+    global last_history_id
+    if last_history_id is None:
+        with get_gmail() as gmail, metrics.timer('gmail', 'getProfile'):
+            last_history_id = gmail.service.users().getProfile(userId='me').execute()['historyId']
+        return False
+
+    try:
+        with get_gmail() as gmail, metrics.timer('gmail', 'history.list'):
+            response = gmail.service.users().history().list(userId='me', startHistoryId=last_history_id, historyTypes='messageAdded', labelId='INBOX').execute()
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        # the saved history id is too old for gmail to remember, so assume something has changed
+        last_history_id = None
+        return True
+    last_history_id = response.get('historyId', last_history_id)
+    return len(response.get('history', [])) > 0
 
 def send_critical_email(message):
     '''
@@ -221,10 +500,8 @@ def send_critical_email(message):
     The message parameter will be included in the body of the email.
     '''
 
-    email_html = get_email('critical')
-    email_html = email_html.replace('%%MESSAGE%%', message)
+    email_html = templates.render('critical', {'MESSAGE': message})
 
-    gmail = get_gmail()
     params = {
         'to': 'ieeesb@g.clemson.edu',
         'sender': 'ieeesb@g.clemson.edu',
@@ -234,9 +511,9 @@ def send_critical_email(message):
     }
 
     if settings.get('Debug') != True:
-        gmail.send_message(**params)
+        with get_gmail() as gmail, metrics.timer('gmail', 'send'):
+            gmail.send_message(**params)
 
     logger.debug(f'Sending critical error message to ieeesb@g.clemson.edu with message: {message}')
 
-# print(get_membership_id_from_email({'name': 'Ignacio Carmichael', 'email': 'ignacic@clemson.edu'}))
-# send_rejection_email({'name': 'David Bootle', 'email': 'dbootle@clemson.edu'})
\ No newline at end of file
+# send_rejection_email(Member('David Bootle', 'dbootle@clemson.edu'))
\ No newline at end of file
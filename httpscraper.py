@@ -0,0 +1,255 @@
+'''
+The functions in this file fetch the TigerQuest prospective member list over plain HTTP.
+TigerQuest renders the roster and the member profiles on the server, so once selenium has
+gone through the Clemson SSO login, the browser's cookies can be handed to a requests session
+and the pages can be downloaded and parsed directly, without rendering them in Chrome.
+
+If a page cannot be parsed (for example because TigerQuest changed its layout or the session
+was logged out), the selenium scraper in webscraper.py is used instead.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from selenium import webdriver
+from log import logger
+from settings import settings
+from dataclasses import replace
+from members import Member
+import webscraper
+import cache
+import roster
+import metrics
+
+PROSPECTIVE_MEMBER_URL = settings['TigerQuest']['prospective_member_url']
+LOGIN_DOMAIN = settings['ClemsonAuth']['login_domain']
+
+# the requests session is kept between loops so its connections to TigerQuest stay open
+session = None
+
+class ParseError(Exception):
+    '''
+    Raised when a TigerQuest page does not look the way the parser expects.
+    '''
+    pass
+
+class RosterPageParser(HTMLParser):
+    '''
+    Collects the member profile links, the checkbox id in the same table row as each link,
+    the next page link, and the pagination markers from a roster page.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.found_grid = False
+        self.member_hrefs = []
+        self.page_ids = []
+        self.row_start = 0
+        self.row_page_id = None
+        self.next_href = None
+        self.table_depth = 0
+        self.in_pagination_right = False
+        self.pagination_depth = 0
+        self.markers = []
+        self.pending_link = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if 'svgGrid' in classes:
+            self.found_grid = True
+        if tag == 'table':
+            self.table_depth += 1
+        elif tag == 'tr':
+            self.row_start = len(self.member_hrefs)
+            self.row_page_id = None
+        elif tag == 'input' and self.table_depth > 0 and attrs.get('type') == 'checkbox':
+            self.row_page_id = attrs.get('value')
+            self.assign_row_page_id()
+        elif tag == 'span' and any(name.startswith('pagination') for name in classes):
+            self.in_pagination_right = 'paginationRight' in classes
+            self.pagination_depth += 1
+        elif tag == 'span' and self.pagination_depth > 0:
+            self.pagination_depth += 1
+        if tag == 'a' and self.pagination_depth > 0 and attrs.get('href'):
+            self.markers.append(attrs['href'])
+        if tag == 'a':
+            if self.table_depth > 0 and 'member-modal' in classes and attrs.get('href'):
+                self.member_hrefs.append(attrs['href'])
+                self.page_ids.append(self.row_page_id)
+            elif self.in_pagination_right:
+                self.pending_link = attrs.get('href')
+
+    def assign_row_page_id(self):
+        # the checkbox can come before or after the link in the row, so fill in any links already seen
+        for index in range(self.row_start, len(self.page_ids)):
+            self.page_ids[index] = self.row_page_id
+
+    def handle_endtag(self, tag):
+        if tag == 'table':
+            self.table_depth = max(0, self.table_depth - 1)
+        elif tag == 'tr':
+            self.assign_row_page_id()
+            self.row_start = len(self.member_hrefs)
+        elif tag == 'span' and self.pagination_depth > 0:
+            self.pagination_depth -= 1
+            self.in_pagination_right = False
+        elif tag == 'a':
+            self.pending_link = None
+
+    def handle_data(self, data):
+        if self.pagination_depth > 0 and data.strip():
+            self.markers.append(' '.join(data.split()))
+        if self.pending_link is not None and data.strip() == 'next':
+            self.next_href = self.pending_link
+
+class ProfileParser(HTMLParser):
+    '''
+    Collects the name (span.fn) and email (a.email) from a member profile page.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.name = None
+        self.email = None
+        self.in_name = False
+        self.name_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if tag == 'span' and 'fn' in classes and self.name is None:
+            self.in_name = True
+        elif tag == 'a' and 'email' in classes and self.email is None:
+            href = attrs.get('href') or ''
+            if href.startswith('mailto:'):
+                self.email = href[7:]
+
+    def handle_endtag(self, tag):
+        if tag == 'span' and self.in_name:
+            self.in_name = False
+            self.name = ' '.join(''.join(self.name_parts).split())
+
+    def handle_data(self, data):
+        if self.in_name:
+            self.name_parts.append(data)
+
+def get_session(driver: webdriver.Chrome) -> requests.Session:
+    '''
+    Returns the shared requests session with the cookies from the logged in browser copied into it.
+    '''
+    global session
+    if session is None:
+        concurrency = max(1, settings['TigerQuest'].get('profile_concurrency', 4))
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+        session.headers['User-Agent'] = driver.execute_script('return navigator.userAgent;')
+
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    return session
+
+def get_page(url: str) -> str:
+    '''
+    Downloads a TigerQuest page and returns its HTML. Raises ParseError if TigerQuest sent us to the login page.
+    '''
+    with metrics.timer('tigerquest', 'http_get'):
+        response = session.get(url, timeout=30)
+    response.raise_for_status()
+    if LOGIN_DOMAIN in response.url:
+        raise ParseError(f'Request for {url} was redirected to the login page.')
+    return response.text
+
+def get_roster_page(url: str, page_number: int) -> tuple[list[dict[str, str]], str|None, list[str]]:
+    '''
+    Downloads one page of the roster. Returns a dictionary for each prospective member on it with
+    their profile link ('href') and the 'page_id', 'page_url', and 'page_number' where they were found,
+    along with the url of the next page (or None if this is the last page) and the page's pagination markers.
+    '''
+    logger.debug(f'Downloading roster page {url}')
+    parser = RosterPageParser()
+    parser.feed(get_page(url))
+    if not parser.found_grid:
+        raise ParseError(f'Could not find the member list on {url}.')
+    rows = []
+    for href, page_id in zip(parser.member_hrefs, parser.page_ids):
+        rows.append({
+            'href': urljoin(url, href),
+            'page_id': page_id,
+            'page_url': url,
+            'page_number': page_number
+        })
+    next_url = urljoin(url, parser.next_href) if parser.next_href else None
+    return rows, next_url, parser.markers
+
+def fetch_member_profile(url: str) -> Member:
+    '''
+    Downloads a member profile and returns the member's name and email.
+    '''
+    parser = ProfileParser()
+    parser.feed(get_page(url))
+    if not parser.name or not parser.email:
+        raise ParseError(f'Could not find the name and email on {url}.')
+    logger.debug(f'Found info for member {parser.name}')
+    return Member(parser.name, parser.email)
+
+def fetch_member_profiles(driver: webdriver.Chrome, urls: list[str]) -> list[Member]:
+    '''
+    Downloads the profile for each url, profile_concurrency at a time, and returns them in the same order.
+    Any profile that cannot be read over HTTP is loaded in the browser instead.
+    '''
+    def fetch_or_none(url: str) -> Member|None:
+        try:
+            return fetch_member_profile(url)
+        except (ParseError, requests.RequestException):
+            logger.debug(f'Failed to read profile {url} over HTTP.', exc_info=True)
+            return None
+
+    concurrency = max(1, settings['TigerQuest'].get('profile_concurrency', 4))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        member_info = list(pool.map(fetch_or_none, urls))
+
+    # any profile that could not be read over HTTP is loaded in the browser instead
+    failed = [index for index, member in enumerate(member_info) if member is None]
+    if len(failed) > 0:
+        logger.warning(f'Failed to read {len(failed)} profiles over HTTP, loading them with selenium.')
+        profiles = webscraper.fetch_member_profiles(driver, [urls[index] for index in failed])
+        for index, profile in zip(failed, profiles):
+            member_info[index] = profile
+
+    return member_info
+
+def read_roster_page_members(driver: webdriver.Chrome, rows: list[dict[str, str]]) -> list[Member]:
+    '''
+    Returns the members for the rows of a roster page from get_roster_page, looking up their profiles.
+    '''
+    profiles = cache.get_profiles([row['href'] for row in rows], lambda urls: fetch_member_profiles(driver, urls))
+    return [
+        replace(profile, page_id=row['page_id'], page_url=row['page_url'], page_number=row['page_number'])
+        for row, profile in zip(rows, profiles)
+    ]
+
+def iter_roster_changes(driver: webdriver.Chrome, scan: roster.RosterScan):
+    '''
+    Yields the changes to the roster since the last scrape, the same as webscraper.iter_roster_changes,
+    but only uses the browser to log in. Only the pages that have changed have their profiles looked up.
+    If a roster page cannot be read over HTTP, the rest of the roster is read with selenium, starting from that page.
+    '''
+    logger.info('Checking the roster for changes over HTTP...')
+    webscraper.load_prospective_member_page(driver) # log in through selenium if necessary
+    get_session(driver)
+
+    url = PROSPECTIVE_MEMBER_URL
+    page_number = 1
+    while url is not None:
+        try:
+            rows, next_url, markers = get_roster_page(url, page_number)
+        except (ParseError, requests.RequestException):
+            logger.warning(f'Failed to read roster page {page_number} over HTTP, falling back to selenium.', exc_info=True)
+            yield from webscraper.iter_roster_changes(driver, scan, url, page_number)
+            return
+
+        yield from scan.page(page_number, [row['href'] for row in rows], markers, lambda: read_roster_page_members(driver, rows))
+        url = next_url
+        page_number += 1
+    yield from scan.finish()
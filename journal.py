@@ -0,0 +1,148 @@
+'''
+The code in this file keeps a journal of the actions the bot takes for each member (such as
+adding a new member or accepting one) in the local database, so that an action interrupted by a
+crash or a restart can be finished without being repeated.
+
+Each action has an idempotency key, made from the member and what the action is about, so the
+same action is never started twice. An action is made of effects, like sending an email or
+changing the sheet, and each effect is recorded as soon as it is done. Sheet changes are only
+buffered until the sheet is flushed, so those effects are recorded when flushed() is called.
+When the bot starts, pending() returns the actions that were not finished so they can be replayed,
+skipping any effects that were already done.
+
+Nothing is recorded in debug mode, since nothing is actually done.
+'''
+
+import json
+import threading
+from time import time
+from typing import Callable
+from log import logger
+from settings import settings
+import storage
+
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS actions (
+        action_key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+''')
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS action_effects (
+        action_key TEXT NOT NULL,
+        effect TEXT NOT NULL,
+        done_at REAL NOT NULL,
+        PRIMARY KEY (action_key, effect)
+    )
+''')
+
+KEEP_FINISHED_DAYS = 90 # finished actions are forgotten after this many days
+
+# held while the effects waiting for a sheet flush are changed
+lock = threading.Lock()
+# held while a buffered effect is made and while the sheet is flushed, so that an effect made in
+# another thread during a flush is never recorded as flushed before it has been sent
+flush_lock = threading.RLock()
+# actions with sheet changes that have not been flushed yet -> names of those effects
+waiting_for_flush = {}
+
+class Action:
+    '''
+    One action for a member. done holds the names of the effects that have already been done.
+    '''
+    def __init__(self, key: str, kind: str, payload: dict, done: set[str], persist: bool = True):
+        self.key = key
+        self.kind = kind
+        self.payload = payload
+        self.done = done
+        self.persist = persist
+        self.finishing = False
+
+    def effect(self, name: str, function: Callable[[], None], buffered: bool = False) -> bool:
+        '''
+        Runs function unless the effect has already been done, and records it. If buffered is True
+        the effect only counts as done once the sheet has been flushed. Returns True if function ran.
+        '''
+        if name in self.done:
+            logger.debug(f'Skipping {name} for {self.key}, it was already done.')
+            return False
+        if buffered:
+            with flush_lock:
+                function()
+                with lock:
+                    waiting_for_flush.setdefault(self, set()).add(name)
+        else:
+            function()
+            self.mark(name)
+        return True
+
+    def mark(self, name: str):
+        '''
+        Records that an effect has been done.
+        '''
+        self.done.add(name)
+        if self.persist:
+            storage.execute('INSERT OR IGNORE INTO action_effects (action_key, effect, done_at) VALUES (?, ?, ?)', (self.key, name, time()))
+
+    def finish(self):
+        '''
+        Marks the action as finished, or as soon as its sheet changes have been flushed if some are still waiting.
+        '''
+        with lock:
+            if self in waiting_for_flush:
+                self.finishing = True
+                return
+        if self.persist:
+            storage.execute('UPDATE actions SET finished_at = ? WHERE action_key = ?', (time(), self.key))
+
+def begin(key: str, kind: str, payload: dict) -> Action|None:
+    '''
+    Starts the action with the given idempotency key, or picks up where it left off if it was
+    interrupted. Returns None if the action has already been finished.
+    '''
+    if settings.get('Debug') == True:
+        return Action(key, kind, payload, set(), persist=False)
+
+    rows = storage.execute('SELECT finished_at FROM actions WHERE action_key = ?', (key,))
+    if rows and rows[0][0] is not None:
+        logger.debug(f'Action {key} has already been done, skipping it.')
+        return None
+    if not rows:
+        storage.execute('INSERT INTO actions (action_key, kind, payload, created_at) VALUES (?, ?, ?, ?)', (key, kind, json.dumps(payload), time()))
+    done = {row[0] for row in storage.execute('SELECT effect FROM action_effects WHERE action_key = ?', (key,))}
+    return Action(key, kind, payload, done)
+
+def flushed():
+    '''
+    Records the sheet changes that have just been flushed, and finishes the actions that were only waiting on them.
+    Call it while holding flush_lock, in the same block as the flush.
+    '''
+    with lock:
+        flushed_actions = list(waiting_for_flush.items())
+        waiting_for_flush.clear()
+    for action, names in flushed_actions:
+        for name in names:
+            action.mark(name)
+        if action.finishing:
+            action.finish()
+
+def pending() -> list[Action]:
+    '''
+    Returns the actions that were started but never finished, oldest first.
+    '''
+    actions = []
+    for key, kind, payload in storage.execute('SELECT action_key, kind, payload FROM actions WHERE finished_at IS NULL ORDER BY created_at'):
+        done = {row[0] for row in storage.execute('SELECT effect FROM action_effects WHERE action_key = ?', (key,))}
+        actions.append(Action(key, kind, json.loads(payload), done))
+    return actions
+
+def forget_old_actions():
+    '''
+    Removes finished actions older than KEEP_FINISHED_DAYS.
+    '''
+    cutoff = time() - KEEP_FINISHED_DAYS * 24 * 60 * 60
+    storage.execute('DELETE FROM action_effects WHERE action_key IN (SELECT action_key FROM actions WHERE finished_at < ?)', (cutoff,))
+    storage.execute('DELETE FROM actions WHERE finished_at < ?', (cutoff,))
@@ -14,131 +14,469 @@ Authorization scope for the project's APIs can be found on google cloud under th
 ieeesb@g.clemson.edu email address.
 '''
 
-from tqdm import tqdm
-from datetime import datetime
-import time
-from sys import exit
+import asyncio
+import threading
+from sys import exit, argv
+from time import perf_counter
+from typing import Callable, Iterator
+from datetime import date
+import json
 
 # Peform local imports
 from log import logger
 import webscraper
+import httpscraper
 import sheets
 import gmail
+import readiness
+import reconcile
+import metrics
+import journal
+import roster
+import storage
+from members import Member, Status
+from roster import RosterChange
+from scheduler import Stage, Scheduler
 from settings import settings
 
-def perform_update():
+# the browser is kept open between loops so that chrome startup and SSO login are not repeated every time
+browser = webscraper.BrowserSession()
+
+class BotState:
     '''
-    The main loop of the script. This function is called every 10 minutes.
+    What each stage has learned, shared with the stages that run after it.
     '''
-    logger.info("Starting new loop iteration...")
-    # fetch the list of prospective members
-    tq_members = webscraper.fetch_prospective_members()
-
-    # check the google sheet and see if any of the prospective members are not already in it
-    sheet_members = sheets.get_list_of_known_members()
-
-    # make a list of members that are in the tq page but not in the sheet
-    logger.info('Calculating list of members in both sheet and tiger quest')
-    tq_emails = [member['email'] for member in tq_members]
-    sheet_emails = [member['email'] for member in sheet_members]
-    pending_members = []
-    for member in tq_members:
-        if member['email'] not in sheet_emails:
-            pending_members.append(member)
-        
-    '''NEW MEMBERS'''
-    # send those members the interest email, then add them to the sheet
-    logger.info('Sending required new member emails...')
-    for member in pending_members:
-        gmail.send_interest_email(member)
+    def __init__(self):
+        self.sheet_members: list[Member] = [] # members in the sheet, kept up to date with the changes made by the bot
+        self.tq_members: list[Member] = [] # prospective members found by the last roster scrape
+        self.membership_ids: dict[str, str] = {} # membership numbers found by the last inbox scan
+        self.sheet_synced = False
+        self.roster_scraped = False
+
+state = BotState()
+
+def build_reconciler() -> reconcile.Reconciler:
+    '''
+    Returns a reconciler loaded with the sheet members and the members from the last roster scrape.
+    '''
+    reconciler = reconcile.Reconciler(state.sheet_members)
+    for member in state.tq_members:
+        reconciler.add_tq_member(member)
+    return reconciler
+
+def check_for_conflicts(plan: reconcile.ActionPlan):
+    '''
+    Stops the program if a member marked as accepted in the sheet is still waiting on TigerQuest.
+    '''
+    if len(plan.conflicts) > 0:
+        # this should not happen unless tigerquest has failed to remove users. if it does, the program will stop to avoid any further issues.
+        member = plan.conflicts[0]
+        gmail.send_critical_email(f'Accepted member {member.name} has not been accepted on the TigerQuest page despite being already marked as accepted in Google Sheets. This should never happen unless there is a problem. The program is stopping to avoid any further issues.')
+        logger.critical(f'Accepted member {member.name} has not been accepted on the TigerQuest page despite being already marked as accepted in Google Sheets. This should never happen unless there is a problem. The program is stopping to avoid any further issues.')
+        exit(1)
+
+def flush_sheet():
+    '''
+    Sends the buffered changes to the sheet, and records them in the action journal.
+    '''
+    with journal.flush_lock:
+        sheets.flush()
+        journal.flushed()
+
+# held while the sheet is being read, so a stage running at the same time can wait for the current sheet
+sheet_sync_lock = threading.RLock()
+
+def sync_sheet() -> bool:
+    '''
+    Sends any buffered changes to the sheet and reads it again, so that edits made by hand are picked up.
+    '''
+    with sheet_sync_lock:
+        flush_sheet()
+        previous = {(member.key, member.status) for member in state.sheet_members}
+        state.sheet_members = sheets.get_list_of_known_members()
+        state.sheet_synced = True
+    return {(member.key, member.status) for member in state.sheet_members} != previous
+
+def ensure_sheet_synced():
+    '''
+    Reads the sheet if it has not been read yet, or waits for a read that is already running.
+    Without it every member would look new.
+    '''
+    with sheet_sync_lock:
+        if not state.sheet_synced:
+            sync_sheet()
+
+def set_tq_members(tq_members: list[Member]):
+    '''
+    Replaces the members from the last roster scrape, and saves them so they are still known after a restart.
+    '''
+    state.tq_members = tq_members
+    state.roster_scraped = True
+    storage.set_value('roster_snapshot', json.dumps([member.to_dict() for member in tq_members]))
+
+def load_roster_snapshot():
+    '''
+    Loads the members saved by the last roster scrape, so the inbox scan and the time limit sweep
+    can run straight after a restart instead of waiting for the whole roster to be read again.
+    '''
+    snapshot = storage.get_value('roster_snapshot')
+    if snapshot is not None:
+        state.tq_members = [Member.from_dict(values) for values in json.loads(snapshot)]
+        state.roster_scraped = True
+        logger.info(f'Loaded {len(state.tq_members)} prospective members from the last roster scrape.')
+
+def open_roster(scan: roster.RosterScan) -> Iterator[RosterChange]:
+    '''
+    Returns a stream of the changes to the TigerQuest roster since the last scrape, read one roster page at a time.
+    '''
+    driver = browser.acquire()
+    if settings['TigerQuest'].get('scrape_backend', 'selenium') == 'http':
+        return httpscraper.iter_roster_changes(driver, scan)
+    else:
+        return webscraper.iter_roster_changes(driver, scan)
+
+'''ACTIONS'''
+# each action is recorded in the journal with an idempotency key, and the parts of it that are already done are skipped when it is replayed
+
+def add_new_member(action: journal.Action, member: Member, in_sheet: bool):
+    '''
+    Sends the interest email to a prospective member, then adds them to the sheet unless they are already in it.
+    '''
+    action.effect('email', lambda: gmail.send_interest_email(member))
+    if not in_sheet:
+        def add_to_sheet():
+            sheets.add_prospective_member_to_sheet(member)
+            state.sheet_members.append(member)
+        action.effect('sheet', add_to_sheet, buffered=True)
+    action.finish()
+
+def approve_member(action: journal.Action, member: Member, membership_id: str):
+    '''
+    Marks the member as approved in the sheet with their membership number, and sends the welcome email.
+    They are accepted on TigerQuest by run_on_tigerquest.
+    '''
+    if member.status != Status.APPROVED:
+        action.effect('sheet', lambda: sheets.member_approved(member, membership_id), buffered=True)
+    action.effect('email', lambda: gmail.send_welcome_email(member))
+
+def remind_member(action: journal.Action, member: Member):
+    '''
+    Sends the reminder email and changes the member's status to 'REMINDER SENT'.
+    '''
+    action.effect('email', lambda: gmail.send_reminder_email(member))
+    if member.status != Status.REMINDER_SENT:
+        action.effect('sheet', lambda: sheets.update_member_status(member, Status.REMINDER_SENT), buffered=True)
+    action.finish()
+
+def expire_member(action: journal.Action, member: Member, in_sheet: bool):
+    '''
+    Removes the member from the sheet and sends the rejection email. They are rejected on TigerQuest by run_on_tigerquest.
+    '''
+    if in_sheet:
+        action.effect('sheet', lambda: sheets.remove_member(member), buffered=True)
+    action.effect('email', lambda: gmail.send_rejection_email(member))
+
+def run_on_tigerquest(pending: list[tuple[journal.Action, Member|None]], function: Callable):
+    '''
+    Runs webscraper.accept_members or webscraper.reject_members for the TigerQuest members of the
+    actions together, then finishes the actions. A member of None means there is nothing to do on TigerQuest.
+    '''
+    tq_members = [tq_member for action, tq_member in pending if tq_member is not None]
+    if len(tq_members) > 0:
+        function(browser.acquire(), tq_members)
+    for action, tq_member in pending:
+        action.mark('tigerquest')
+        action.finish()
+
+def replay_pending_actions():
+    '''
+    Finishes the actions that were interrupted the last time the bot stopped, skipping the parts that were already done.
+    '''
+    actions = journal.pending()
+    if len(actions) == 0:
+        return
+    logger.info(f'Replaying {len(actions)} unfinished actions from before the last restart.')
+    reconciler = build_reconciler()
+    to_accept = []
+    to_reject = []
+    for action in actions:
+        saved = Member.from_dict(action.payload['member'])
+        member = reconciler.sheet_by_email.get(saved.key)
+        tq_member = reconciler.tq_by_email.get(saved.key) if 'tigerquest' not in action.done else None
+        if action.kind == 'new_member':
+            add_new_member(action, saved, in_sheet=member is not None)
+        elif member is None and action.kind in ('accept', 'reminder'):
+            logger.warning(f'{saved.name} is no longer in the sheet, dropping their unfinished {action.kind} action.')
+            action.finish()
+        elif action.kind == 'accept':
+            approve_member(action, member, action.payload['membership_id'])
+            to_accept.append((action, tq_member))
+        elif action.kind == 'reminder':
+            remind_member(action, member)
+        elif action.kind == 'reject':
+            expire_member(action, saved, in_sheet=member is not None)
+            to_reject.append((action, tq_member))
+    run_on_tigerquest(to_accept, webscraper.accept_members)
+    run_on_tigerquest(to_reject, webscraper.reject_members)
+
+def recover():
+    '''
+    Gets ready to run after a restart: loads the last roster scrape, reads the sheet, and finishes
+    any actions that were interrupted.
+    '''
+    journal.forget_old_actions()
+    load_roster_snapshot()
+    try:
+        sync_sheet()
+        replay_pending_actions()
+        flush_sheet()
+    except Exception:
+        # the actions stay in the journal and are replayed on the next start, and the stages read the sheet again when they run
+        logger.exception('Failed to replay the unfinished actions.')
+
+'''STAGES'''
+def handle_new_member(member: Member):
+    '''
+    Sends the interest email to a prospective member that is not in the sheet yet, then adds them to the sheet.
+    '''
+    action = journal.begin(f'new:{member.key}:{member.page_id or date.today()}', 'new_member', {'member': member.to_dict()})
+    if action is not None:
+        add_new_member(action, member, in_sheet=False)
+    else:
+        # they were handled before, so their row was deleted from the sheet by hand. add it back without emailing them again
+        logger.warning(f'{member.name} is still on TigerQuest but is missing from the sheet, adding them again.')
         sheets.add_prospective_member_to_sheet(member)
-    
+        state.sheet_members.append(member)
+
+def handle_missing_members(reconciler: reconcile.Reconciler, scan: roster.RosterScan):
+    '''
+    Handles the members on the roster who are not in the sheet but were not reported as added, such
+    as a member whose row was deleted by hand. This only compares the lists, nothing is read again.
+    '''
+    for member in scan.members:
+        if reconciler.add_tq_member(member):
+            handle_new_member(member)
+
+def finish_roster(scan: roster.RosterScan) -> bool:
+    '''
+    Saves the members found by a roster scrape, and returns True if the roster changed since the last scrape.
+    '''
+    changed = not state.roster_scraped or len(scan.changes) > 0
+    set_tq_members(scan.members)
+    flush_sheet()
+    readiness.log_latency_summary()
+    return changed
+
+def scrape_roster() -> bool:
+    '''
+    Checks the TigerQuest roster for changes, and sends the interest email to any prospective members that are new.
+    The sheet is only needed once a new member is found, so the roster can be read while the sheet sync stage is still running.
+    '''
+    '''NEW MEMBERS'''
+    # any prospective member added to the roster that is not already in the sheet is sent the interest email, then added to the sheet
+    logger.info('Sending required new member emails as prospective members are found...')
+    scan = roster.RosterScan()
+    reconciler = None
+    for change in open_roster(scan):
+        if change.kind != 'added':
+            continue
+        if reconciler is None:
+            ensure_sheet_synced()
+            reconciler = reconcile.Reconciler(state.sheet_members)
+        if reconciler.add_tq_member(change.member):
+            handle_new_member(change.member)
+    if reconciler is None:
+        ensure_sheet_synced()
+        reconciler = reconcile.Reconciler(state.sheet_members)
+    handle_missing_members(reconciler, scan)
+    return finish_roster(scan)
+
+def scan_inbox(scan_new_messages: bool = True) -> bool:
+    '''
+    Looks for membership numbers in the inbox, and accepts the members who have sent one in.
+    scan_new_messages can be False if gmail.scan_new_messages has just been called.
+    '''
+    if not state.roster_scraped:
+        return False
+    ensure_sheet_synced()
+    reconciler = build_reconciler()
+
     '''CHECK FOR MEMBER RESPONSES IN THE EMAIL'''
-    # for each member in tigerquest, check to see if they have emailed their membership status
+    # search the inbox once for every member that is on the tq page and has not been accepted yet
     logger.info('Checking for member number responses...')
-    accepted_members = []
-    for member in sheet_members:
-        # if the member is on the tq page, see if they have emailed their membership status
-        # also check if they have already been accepted
-        if member['email'] in tq_emails and member['status'] != 'ACCEPTED':
-            id = gmail.get_membership_id_from_email(member)
-            if id is not None:
-                # if they have emailed their membership status, update their status in the sheet and accept them in tigerquest and email them the welcome message
-                accepted_members.append(member)
-                sheets.member_approved(member, id)
-                gmail.send_welcome_email(member)
-                # remove from tq list
-                for tq_member in tq_members:
-                    if tq_member['email'] == member['email']:
-                        tq_members.remove(tq_member)
-        elif member['status'] == 'ACCEPTED':
-            # this should not happen unless tigerquest has failed to remove users. if it does, the program will stop to avoid any further issues.
-            gmail.send_critical_email(f'Accepted member {member['name']} has not been accepted on the TigerQuest page despite being already marked as accepted in Google Sheets. This should never happen unless there is a problem. The program is stopping to avoid any further issues.')
-            logger.critical(f'Accepted member {member["name"]} has not been accepted on the TigerQuest page despite being already marked as accepted in Google Sheets. This should never happen unless there is a problem. The program is stopping to avoid any further issues.')
-            exit(1)
-            
-    if len(accepted_members) > 0:
-        webscraper.accept_members(accepted_members)
-
-    # recalculate tq emails from modified tq members list
-    tq_emails = [member['email'] for member in tq_members] 
-
-    # only refresh the sheet if there are pending members or accepted members
-    # if there are not pending members or accepted members, the sheet is already up to date
-    if (len(pending_members) + len(accepted_members)) != 0:
-        logger.debug('Sheet is not up to date, refreshing...')
-        sheet_members = sheets.get_list_of_known_members()
-    
+    state.membership_ids = gmail.get_membership_ids(reconciler.accept_candidates(), scan_new_messages)
+
+    plan = reconciler.plan(state.membership_ids)
+    check_for_conflicts(plan)
+
+    # for members who have emailed their membership status, update their status in the sheet, accept them in tigerquest and email them the welcome message
+    to_accept = []
+    for member, tq_member, id in plan.accept:
+        action = journal.begin(f'accept:{member.key}:{id}', 'accept', {'member': member.to_dict(), 'membership_id': id})
+        if action is None:
+            continue
+        approve_member(action, member, id)
+        to_accept.append((action, tq_member if 'tigerquest' not in action.done else None))
+    run_on_tigerquest(to_accept, webscraper.accept_members)
+    if len(plan.accept) > 0:
+        accepted = {member.key for member, tq_member, id in plan.accept}
+        set_tq_members([member for member in state.tq_members if member.key not in accepted])
+    flush_sheet()
+
+    gmail.log_client_stats()
+    return len(plan.accept) > 0
+
+def sweep_time_limits() -> bool:
+    '''
+    Sends reminders to members who have not replied to the interest email, and rejects members who
+    have not replied to the reminder.
+    '''
+    if not state.roster_scraped:
+        return False
+    ensure_sheet_synced()
+    reconciler = build_reconciler()
+    plan = reconciler.plan(state.membership_ids)
+    logger.info(f'Action plan: {plan.summary()}')
+    check_for_conflicts(plan)
+
     '''SEND REMINDERS'''
-    # get a list of members that are in the sheet, but have a status of 'EMAIL SENT' and a status date more than a week ago
+    # members with a status of 'EMAIL SENT' more than a week ago are sent a reminder email and their status is changed to 'REMINDER SENT'
     logger.info('Sending out initial reminder emails...')
-    for member in sheet_members:
-        # if the member was sent an email more than a week ago, send a reminder email and change their status to 'REMINDER SENT'
-        if member['status'] == 'EMAIL SENT' and (datetime.now() - datetime.strptime(member['status_date'], '%m/%d/%y')).days > 7:
-            gmail.send_reminder_email(member)
-            sheets.update_member_status(member, 'REMINDER SENT')
+    for member in plan.reminders:
+        action = journal.begin(f'reminder:{member.key}:{member.status_date_text}', 'reminder', {'member': member.to_dict()})
+        if action is not None:
+            remind_member(action, member)
 
     '''REMOVE MEMBERS WHO HAVE CANCELLED THEIR MEMBERSHIP'''
-    # Find members who are not on the tq page, but do not have a status of 'APPROVED'. If they cancelled their own membership, they should be be marked as a cancelled member
+    # Members who are not on the tq page, but do not have a status of 'APPROVED' may have cancelled their own membership. They should be be marked as a cancelled member
     # logger.info('Checking for members that removed their application...')
-    # cancelled_members = [member for member in sheet_members if member['email'] not in tq_emails and member['status'] != 'APPROVED']
-    # for member in cancelled_members:
-    #     sheets.update_member_status(member, 'SELF-CANCEL')
+    # for member in state.sheet_members:
+    #     if member.key not in reconciler.tq_by_email and member.status != Status.APPROVED:
+    #         sheets.update_member_status(member, Status.SELF_CANCEL)
     
     '''REJECT MEMBERS WHO HAVE NOT RESPONDED WITHIN THE TIME LIMIT'''
-    # get a list of members that are in the sheet and on the tq page, but have a status of 'REMINDER SENT' and a status date more than a week ago
+    # members with a status of 'REMINDER SENT' more than a week ago are removed from the sheet and sent a rejection email, and rejected on tigerquest if they are still there
     logger.info('Rejecting members with expired time limit...')
-    members_to_remove_from_tq = []
-    for member in sheet_members:
-        # if the member was sent a reminder more than a week ago
-        if member['status'] == 'REMINDER SENT' and (datetime.now() - datetime.strptime(member['status_date'], '%m/%d/%y')).days > 7:
-            # if the member is on the tq page, reject them and remove them from the sheet
-            if member['email'] in tq_emails:
-                members_to_remove_from_tq.append(member)
-            
-            sheets.remove_member(member) # remove them from the sheet
-            gmail.send_rejection_email(member) # send them a rejection email
-    if len(members_to_remove_from_tq) > 0:
-        webscraper.reject_members(members_to_remove_from_tq)
-
-if settings.get('Debug') == True:
-    logger.warning('Debug mode is enabled. No permanent actions will be taken.')
-
-while True:
+    to_reject = []
+    for member in plan.expired:
+        action = journal.begin(f'reject:{member.key}:{member.status_date_text}', 'reject', {'member': member.to_dict()})
+        if action is None:
+            continue
+        expire_member(action, member, in_sheet=True)
+        tq_member = reconciler.tq_by_email.get(member.key)
+        to_reject.append((action, tq_member if 'tigerquest' not in action.done else None))
+    run_on_tigerquest(to_reject, webscraper.reject_members)
+    expired = {member.key for member in plan.expired}
+    state.sheet_members = [member for member in state.sheet_members if member.key not in expired]
+    if len(expired) > 0:
+        set_tq_members([member for member in state.tq_members if member.key not in expired])
+    flush_sheet()
+
+    return len(plan.reminders) > 0 or len(plan.expired) > 0
+
+async def scrape_roster_async(sheet_synced: asyncio.Task) -> bool:
+    '''
+    Checks the roster for changes in a worker thread and passes them back through a queue. New members
+    are handled as they arrive, once the sheet has been read, while later roster pages are still loading.
+    '''
+    loop = asyncio.get_running_loop()
+    found = asyncio.Queue()
+    scan = roster.RosterScan()
+
+    def read_roster():
+        try:
+            for change in open_roster(scan):
+                loop.call_soon_threadsafe(found.put_nowait, change)
+        finally:
+            # None marks the end of the roster
+            loop.call_soon_threadsafe(found.put_nowait, None)
+
+    reader = asyncio.create_task(asyncio.to_thread(read_roster))
     try:
+        await sheet_synced
+        reconciler = reconcile.Reconciler(state.sheet_members)
+
+        '''NEW MEMBERS'''
+        logger.info('Sending required new member emails as prospective members are found...')
+        while (change := await found.get()) is not None:
+            if change.kind == 'added' and reconciler.add_tq_member(change.member):
+                handle_new_member(change.member)
+        handle_missing_members(reconciler, scan)
+    except BaseException:
+        # the browser is still in use until the reader stops, so let it finish before giving up
+        await asyncio.wait([reader])
+        raise
+    await reader
+    return await asyncio.to_thread(finish_roster, scan)
+
+async def run_cycle():
+    '''
+    Runs every stage once. The sheet read, the roster scrape, and the scan of new inbox messages do
+    not depend on each other, so they run at the same time in worker threads. The inbox lookup for
+    pending members and the time limit sweep need all three, so they run once those have finished.
+    '''
+    sheet_synced = asyncio.create_task(asyncio.to_thread(sync_sheet))
+    await asyncio.gather(
+        sheet_synced,
+        scrape_roster_async(sheet_synced),
+        asyncio.to_thread(gmail.scan_new_messages),
+    )
+    await asyncio.to_thread(scan_inbox, False)
+    await asyncio.to_thread(sweep_time_limits)
+
+def perform_update():
+    '''
+    Runs every stage once and waits for the emails to be sent.
+    '''
+    logger.info("Starting new loop iteration...")
+    start = perf_counter()
+    asyncio.run(run_cycle())
+    logger.info(f'Stages finished in {perf_counter() - start:.2f} seconds.')
+
+    # emails are sent in the background, wait for all of them before finishing the loop
+    logger.info('Waiting for queued emails to finish sending...')
+    gmail.wait_for_outbox()
+    metrics.end_cycle()
+
+if __name__ == '__main__':
+    if settings.get('Debug') == True:
+        logger.warning('Debug mode is enabled. No permanent actions will be taken.')
+
+    # keep the local sent email ledger in line with the sent folder in the background
+    gmail.start_ledger_reconciliation()
+    # send any emails left over from before the last restart, and keep retrying failed ones
+    gmail.start_outbox()
+    metrics.start_server()
+
+    # finish anything that was interrupted when the bot last stopped
+    recover()
+
+    # run every stage once and stop, instead of running on the schedule
+    if '--once' in argv:
         perform_update()
-    except Exception as e:
-        logger.exception('An exception ocurred in the run loop that caused the program to terminate this iteration.')
+        exit(0)
 
-    if not settings.get('System') or not settings.get('System').get('sleep_minutes'):
+    system_settings = settings.get('System', {})
+    scheduler_settings = settings.get('Scheduler', {})
+    if not system_settings.get('sleep_minutes') and not scheduler_settings.get('roster_minutes'):
         logger.warning('WARNING: Sleep time not specified! Defaulting to 10 mins. Please see README for auth.toml.')
-        sleep_time = 10
-    else:
-        sleep_time = settings['System']['sleep_minutes']
-    
-    # default sleep time to 10 mins if not specified
-    logger.info(f'Finished current loop. Sleeping for {sleep_time} minutes.')
+    roster_minutes = scheduler_settings.get('roster_minutes', system_settings.get('sleep_minutes', 10))
+    max_idle_multiplier = scheduler_settings.get('max_idle_multiplier', 4)
 
-    for i in tqdm(range(sleep_time*60), desc="Waiting"):
-        time.sleep(1)
-    
\ No newline at end of file
+    # the sheet sync, the roster scrape, and the download of new emails do not depend on each other, so they run at the
+    # same time. accepting members and the time limit sweep need all three, so they run after them
+    inbox_minutes = scheduler_settings.get('inbox_minutes', roster_minutes)
+    scheduler = Scheduler(
+        [
+            Stage('sheet sync', sync_sheet, scheduler_settings.get('sheet_sync_minutes', roster_minutes), max_idle_multiplier),
+            Stage('roster scrape', scrape_roster, roster_minutes, max_idle_multiplier),
+            Stage('inbox fetch', gmail.scan_new_messages, inbox_minutes, max_idle_multiplier),
+            Stage('inbox scan', lambda: scan_inbox(scan_new_messages=False), inbox_minutes, max_idle_multiplier),
+            Stage('time limit sweep', sweep_time_limits, scheduler_settings.get('sweep_minutes', 60), max_idle_multiplier),
+        ],
+        wake_check=gmail.has_new_messages,
+        wake_stages=['inbox fetch', 'inbox scan'],
+        poll_seconds=scheduler_settings.get('gmail_poll_seconds', 60),
+        concurrent_stages=['sheet sync', 'roster scrape', 'inbox fetch'],
+    )
+    scheduler.run_forever()
@@ -0,0 +1,104 @@
+'''
+The Member class in this file is the record for a prospective or current member that is passed
+between the TigerQuest, Google Sheets, and Gmail code. Not every field is known by every source:
+TigerQuest knows where the member is on the roster, and the sheet knows their status and row.
+'''
+
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from enum import StrEnum
+from log import logger
+
+DATE_FORMAT = '%m/%d/%y' # format of the status dates in the sheet
+
+class Status(StrEnum):
+    '''
+    The status of a member in the sheet.
+    '''
+    NONE = ''
+    EMAIL_SENT = 'EMAIL SENT'
+    REMINDER_SENT = 'REMINDER SENT'
+    APPROVED = 'APPROVED'
+    ACCEPTED = 'ACCEPTED'
+    SELF_CANCEL = 'SELF-CANCEL'
+    UNKNOWN = 'UNKNOWN'
+
+    @classmethod
+    def parse(cls, text: str) -> 'Status':
+        '''
+        Returns the status written in a sheet cell, or UNKNOWN if it is not one the bot uses.
+        '''
+        try:
+            return cls(text.strip())
+        except ValueError:
+            logger.warning(f'Unknown member status {text!r} in the sheet.')
+            return cls.UNKNOWN
+
+def normalize_email(email: str) -> str:
+    '''
+    Returns the email in lower case, with @g.clemson.edu replaced by @clemson.edu so both forms of
+    the same address match.
+    '''
+    email = email.strip().lower()
+    if email.endswith('@g.clemson.edu'):
+        return email[:-len('@g.clemson.edu')] + '@clemson.edu'
+    return email
+
+def parse_status_date(text: str) -> datetime|None:
+    '''
+    Parses a status date from the sheet, or returns None if the cell is not a valid date.
+    '''
+    try:
+        return datetime.strptime(text, DATE_FORMAT)
+    except ValueError:
+        return None
+
+@dataclass(slots=True)
+class Member:
+    name: str
+    email: str
+    status: Status = Status.NONE
+    status_date: datetime|None = None
+    membership_id: str = ''
+    sheet_row: int|None = None # row of the member in the sheet
+    page_id: str|None = None # id of the member's checkbox on the TigerQuest roster
+    page_url: str|None = None # url of the TigerQuest roster page the member was found on
+    page_number: int|None = None # number of that roster page, starting from 1
+    key: str = field(init=False) # normalized email, used to match the same member across sources
+
+    def __post_init__(self):
+        self.key = normalize_email(self.email)
+
+    @property
+    def first_name(self) -> str:
+        return self.name.split(' ')[0]
+
+    @property
+    def status_date_text(self) -> str:
+        '''
+        Returns the status date the way it is written in the sheet.
+        '''
+        return self.status_date.strftime(DATE_FORMAT) if self.status_date is not None else ''
+
+    def to_dict(self) -> dict:
+        '''
+        Returns the member as a JSON serializable dictionary.
+        '''
+        values = asdict(self)
+        del values['key']
+        values['status_date'] = self.status_date.isoformat() if self.status_date is not None else None
+        return values
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'Member':
+        '''
+        Rebuilds a member from a dictionary made by to_dict.
+        '''
+        values = {name: value for name, value in values.items() if name in cls.__dataclass_fields__ and name != 'key'}
+        values['status'] = Status.parse(values.get('status', ''))
+        if values.get('status_date') is not None:
+            try:
+                values['status_date'] = datetime.fromisoformat(values['status_date'])
+            except ValueError:
+                values['status_date'] = parse_status_date(values['status_date'])
+        return cls(**values)
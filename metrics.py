@@ -0,0 +1,192 @@
+'''
+The functions in this file time and count every call the bot makes to TigerQuest, Google Sheets,
+and Gmail, so that a slow loop can be traced to the service (and the call) that made it slow.
+
+Calls are recorded with timer() under an api name and an operation name. At the end of each cycle,
+end_cycle() logs the number of calls, errors, and the median and 95th percentile latency of each
+operation during the cycle, and appends the same summary to a JSONL file. The running totals can
+also be read in the Prometheus text format from a small local HTTP server.
+
+Both are off unless they are turned on in the [Metrics] section of auth.toml, by setting the JSONL
+file (jsonl_file) or the port of the HTTP server (port, 0 to keep it off).
+'''
+
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+from log import logger
+from settings import settings
+
+metrics_settings = settings.get('Metrics', {})
+JSONL_FILE = metrics_settings.get('jsonl_file', '')
+PORT = metrics_settings.get('port', 0)
+
+# upper bounds (in seconds) of the histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+# held while any of the tables below are read or changed, since calls are recorded from several threads
+lock = threading.Lock()
+# (api, operation) -> totals since the bot started, for the Prometheus endpoint
+totals = {}
+# (api, operation) -> latencies recorded during the current cycle
+cycle_latencies = {}
+# (api, operation) -> number of errors during the current cycle
+cycle_errors = {}
+# event name -> count since the bot started, for things that are not calls such as cache hits
+events = {}
+cycle_start = perf_counter()
+
+def percentile(samples: list[float], fraction: float) -> float:
+    '''
+    Returns the value below which the given fraction of the samples fall.
+    '''
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def record_call(api: str, operation: str, seconds: float, failed: bool = False):
+    '''
+    Records one call to an api and how long it took.
+    '''
+    key = (api, operation)
+    with lock:
+        total = totals.setdefault(key, {'calls': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(BUCKETS)})
+        total['calls'] += 1
+        total['seconds'] += seconds
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                total['buckets'][index] += 1
+                break
+        cycle_latencies.setdefault(key, []).append(seconds)
+        if failed:
+            total['errors'] += 1
+            cycle_errors[key] = cycle_errors.get(key, 0) + 1
+
+@contextmanager
+def timer(api: str, operation: str):
+    '''
+    Times the code inside the with block as one call to the api. If it raises an exception, the
+    call is also counted as an error.
+    '''
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_call(api, operation, perf_counter() - start, failed=True)
+        raise
+    record_call(api, operation, perf_counter() - start)
+
+def count(event: str, amount: int = 1):
+    '''
+    Adds to the count of an event that is not a call, such as a cache hit.
+    '''
+    with lock:
+        events[event] = events.get(event, 0) + amount
+
+def end_cycle() -> dict:
+    '''
+    Logs a summary of the calls made since the last cycle ended, appends it to the JSONL file,
+    and starts a new cycle. Returns the summary.
+    '''
+    global cycle_start
+    with lock:
+        latencies = dict(cycle_latencies)
+        errors = dict(cycle_errors)
+        cycle_latencies.clear()
+        cycle_errors.clear()
+        cycle_seconds = perf_counter() - cycle_start
+        cycle_start = perf_counter()
+
+    summary = {'time': datetime.now().astimezone().isoformat(), 'cycle_seconds': round(cycle_seconds, 3), 'apis': {}}
+    for (api, operation), samples in sorted(latencies.items()):
+        summary['apis'].setdefault(api, {})[operation] = {
+            'calls': len(samples),
+            'errors': errors.get((api, operation), 0),
+            'seconds': round(sum(samples), 3),
+            'p50': round(percentile(samples, 0.5), 3),
+            'p95': round(percentile(samples, 0.95), 3),
+        }
+
+    for api, operations in summary['apis'].items():
+        details = ', '.join(f"{operation} {values['calls']} calls ({values['errors']} errors) p50 {values['p50']:.2f}s p95 {values['p95']:.2f}s" for operation, values in operations.items())
+        logger.info(f"{api}: {sum(values['calls'] for values in operations.values())} calls in {sum(values['seconds'] for values in operations.values()):.2f}s - {details}")
+
+    if JSONL_FILE:
+        try:
+            with open(JSONL_FILE, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
+        except OSError:
+            logger.exception(f'Failed to write metrics to {JSONL_FILE}.')
+    return summary
+
+def render_prometheus() -> str:
+    '''
+    Returns the totals since the bot started in the Prometheus text format.
+    '''
+    lines = [
+        '# HELP tigerquest_bot_api_calls_total Calls made to each external api.',
+        '# TYPE tigerquest_bot_api_calls_total counter',
+    ]
+    with lock:
+        items = sorted((key, {**total, 'buckets': list(total['buckets'])}) for key, total in totals.items())
+        event_items = sorted(events.items())
+
+    for (api, operation), total in items:
+        lines.append(f'tigerquest_bot_api_calls_total{{api="{api}",operation="{operation}"}} {total["calls"]}')
+    lines += [
+        '# HELP tigerquest_bot_api_errors_total Calls to each external api that raised an error.',
+        '# TYPE tigerquest_bot_api_errors_total counter',
+    ]
+    for (api, operation), total in items:
+        lines.append(f'tigerquest_bot_api_errors_total{{api="{api}",operation="{operation}"}} {total["errors"]}')
+    lines += [
+        '# HELP tigerquest_bot_api_call_seconds Time taken by calls to each external api.',
+        '# TYPE tigerquest_bot_api_call_seconds histogram',
+    ]
+    for (api, operation), total in items:
+        labels = f'api="{api}",operation="{operation}"'
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, total['buckets']):
+            cumulative += bucket_count
+            lines.append(f'tigerquest_bot_api_call_seconds_bucket{{{labels},le="{"+Inf" if bound == float("inf") else bound}"}} {cumulative}')
+        lines.append(f'tigerquest_bot_api_call_seconds_sum{{{labels}}} {total["seconds"]}')
+        lines.append(f'tigerquest_bot_api_call_seconds_count{{{labels}}} {total["calls"]}')
+    lines += [
+        '# HELP tigerquest_bot_events_total Counts of events that are not api calls.',
+        '# TYPE tigerquest_bot_events_total counter',
+    ]
+    for event, event_count in event_items:
+        lines.append(f'tigerquest_bot_events_total{{event="{event}"}} {event_count}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    '''
+    Starts serving the metrics at http://127.0.0.1:<port>/metrics in a background thread, unless the port is 0.
+    '''
+    if not PORT:
+        return
+    try:
+        server = ThreadingHTTPServer(('127.0.0.1', PORT), MetricsHandler)
+    except OSError:
+        logger.exception(f'Failed to start the metrics server on port {PORT}.')
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+    logger.info(f'Serving metrics at http://127.0.0.1:{PORT}/metrics')
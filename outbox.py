@@ -0,0 +1,176 @@
+'''
+The code in this file sends outbound emails from a queue, using a small pool of worker threads so
+that a large batch of emails does not hold up the rest of the loop. Sends are limited by a token
+bucket to stay inside the Gmail API quota, and sends that hit a rate limit or a server error are
+retried with exponential backoff.
+
+Every queued email is saved in the local database until it has been sent, so emails that were
+still waiting are sent again after a restart. The outbox should be started when the bot starts,
+so those emails do not wait for the next new one. An email that fails every attempt is queued
+again later, waiting twice as long after each failed round, up to max_retry_seconds.
+'''
+
+import json
+import queue
+import random
+import threading
+from time import monotonic, sleep
+from typing import Callable
+from googleapiclient.errors import HttpError
+from log import logger
+import storage
+
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS outbox (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        failed INTEGER NOT NULL DEFAULT 0
+    )
+''')
+
+# status codes that mean the request can be tried again later
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    '''
+    Allows up to rate operations per second on average, with bursts of up to capacity operations.
+    '''
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        '''
+        Blocks until a token is available, then uses it.
+        '''
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+class Outbox:
+    '''
+    A queue of outbound jobs. Each job has a kind, which selects the handler that sends it, and a
+    JSON serializable payload that is passed to the handler. The failed column of a job counts the
+    rounds of attempts it has failed, and sets how long to wait before the next round.
+    '''
+    def __init__(self, handlers: dict[str, Callable[[dict], None]], workers: int, rate: float, burst: int, max_attempts: int, retry_seconds: float = 300, max_retry_seconds: float = 6 * 60 * 60):
+        self.handlers = handlers
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.jobs = queue.Queue()
+        self.started = False
+        self.start_lock = threading.Lock()
+        # job id -> monotonic time when a failed job is next tried
+        self.retry_at = {}
+        self.retry_lock = threading.Lock()
+
+    def start(self):
+        '''
+        Starts the worker threads and the retry thread, and queues any jobs left over from before
+        the last restart. Does nothing if the outbox is already running.
+        '''
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+
+        leftover = storage.execute('SELECT job_id, kind, payload FROM outbox ORDER BY job_id')
+        if len(leftover) > 0:
+            logger.info(f'Queueing {len(leftover)} emails left over from before the last restart.')
+            storage.execute('UPDATE outbox SET failed = 0')
+        for job_id, kind, payload in leftover:
+            self.jobs.put((job_id, kind, json.loads(payload)))
+
+        for index in range(self.workers):
+            threading.Thread(target=self.work, name=f'Outbox-{index}', daemon=True).start()
+        threading.Thread(target=self.retry_forever, name='OutboxRetry', daemon=True).start()
+
+    def enqueue(self, kind: str, payload: dict):
+        '''
+        Saves a job and queues it to be sent.
+        '''
+        self.start()
+        rows = storage.execute('INSERT INTO outbox (kind, payload) VALUES (?, ?) RETURNING job_id', (kind, json.dumps(payload)))
+        self.jobs.put((rows[0][0], kind, payload))
+
+    def wait(self):
+        '''
+        Blocks until every queued job has either been sent or has failed for good.
+        '''
+        self.jobs.join()
+        failed = storage.execute('SELECT COUNT(*) FROM outbox WHERE failed > 0')[0][0]
+        if failed > 0:
+            logger.warning(f'{failed} emails have failed to send and will be tried again later.')
+
+    def retry_failed(self):
+        '''
+        Queues the failed jobs whose wait before the next round of attempts is over.
+        '''
+        now = monotonic()
+        with self.retry_lock:
+            due = [job_id for job_id, retry_at in self.retry_at.items() if retry_at <= now]
+            for job_id in due:
+                del self.retry_at[job_id]
+        for job_id in due:
+            rows = storage.execute('SELECT kind, payload FROM outbox WHERE job_id = ?', (job_id,))
+            if rows:
+                logger.info(f'Retrying {rows[0][0]} job {job_id}.')
+                self.jobs.put((job_id, rows[0][0], json.loads(rows[0][1])))
+
+    def retry_forever(self):
+        while True:
+            sleep(60)
+            try:
+                self.retry_failed()
+            except Exception:
+                logger.exception('Failed to queue the failed emails again.')
+
+    def work(self):
+        while True:
+            job_id, kind, payload = self.jobs.get()
+            try:
+                self.deliver(job_id, kind, payload)
+            finally:
+                self.jobs.task_done()
+
+    def deliver(self, job_id: int, kind: str, payload: dict):
+        '''
+        Runs the job's handler, retrying with backoff on rate limits and server errors.
+        The job is removed from the database once it succeeds, or marked as failed if it never does.
+        '''
+        for attempt in range(1, self.max_attempts + 1):
+            self.bucket.take()
+            try:
+                self.handlers[kind](payload)
+                storage.execute('DELETE FROM outbox WHERE job_id = ?', (job_id,))
+                return
+            except HttpError as e:
+                if e.resp.status not in RETRYABLE_STATUSES or attempt == self.max_attempts:
+                    logger.exception(f'Failed to send {kind} job {job_id} after {attempt} attempts.')
+                    break
+                backoff = min(60, 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(f'Gmail returned {e.resp.status} for {kind} job {job_id}, retrying in {backoff:.1f} seconds.')
+                sleep(backoff)
+            except Exception:
+                logger.exception(f'Failed to send {kind} job {job_id}.')
+                break
+
+        rows = storage.execute('UPDATE outbox SET failed = failed + 1 WHERE job_id = ? RETURNING failed', (job_id,))
+        wait = min(self.max_retry_seconds, self.retry_seconds * 2 ** (rows[0][0] - 1))
+        logger.warning(f'Will try {kind} job {job_id} again in {wait / 60:.0f} minutes.')
+        with self.retry_lock:
+            self.retry_at[job_id] = monotonic() + wait
@@ -0,0 +1,90 @@
+'''
+The functions in this file wait for TigerQuest pages in the browser to be ready, instead of
+sleeping for a fixed amount of time. Every wait is recorded under a step name, and the time
+allowed for a step adapts to how long that step has taken recently, so a wait that is going
+to fail gives up early instead of always sitting through the full timeout. Waits whose failure
+stops the bot (approving and denying members) are passed adaptive=False and always get their full timeout.
+
+The recorded latencies are also kept as histograms so the log can show where the time in a
+loop is actually being spent.
+'''
+
+from collections import deque
+from time import perf_counter
+from typing import Callable
+from selenium import webdriver
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+from log import logger
+from metrics import percentile
+import metrics
+from settings import settings
+
+readiness_settings = settings.get('Readiness', {})
+MIN_TIMEOUT = readiness_settings.get('min_timeout', 10) # never wait less than this many seconds
+TIMEOUT_MULTIPLIER = readiness_settings.get('timeout_multiplier', 4) # allow this many times the usual (p95) latency
+MIN_SAMPLES = 10 # number of samples needed before the timeout starts adapting
+
+# upper bounds (in seconds) of the histogram buckets
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+recent_latencies = {} # step name -> the most recent latencies
+histograms = {} # step name -> a count for each bucket
+
+def record_latency(step: str, seconds: float):
+    '''
+    Records how long a step took.
+    '''
+    recent_latencies.setdefault(step, deque(maxlen=200)).append(seconds)
+    counts = histograms.setdefault(step, [0] * len(BUCKETS))
+    for index, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            counts[index] += 1
+            break
+
+def get_timeout(step: str, max_timeout: float) -> float:
+    '''
+    Returns how long to wait for a step. Until enough samples have been recorded this is max_timeout,
+    after that it is a multiple of the step's recent 95th percentile latency, kept between
+    min_timeout and max_timeout.
+    '''
+    samples = recent_latencies.get(step)
+    if samples is None or len(samples) < MIN_SAMPLES:
+        return max_timeout
+    return min(max_timeout, max(MIN_TIMEOUT, percentile(samples, 0.95) * TIMEOUT_MULTIPLIER))
+
+def wait_until(driver: webdriver.Chrome, step: str, condition: Callable, max_timeout: float, adaptive: bool = True):
+    '''
+    Waits for condition (an expected condition or any function of the driver) to be met and
+    returns its result. Raises selenium's TimeoutException if it is not met within the step's timeout.
+    If adaptive is False the step always gets max_timeout, its latency is still recorded.
+    '''
+    timeout = get_timeout(step, max_timeout) if adaptive else max_timeout
+    start = perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=0.1).until(condition)
+    except TimeoutException:
+        record_latency(step, perf_counter() - start)
+        metrics.record_call('tigerquest', f'wait_{step}', perf_counter() - start, failed=True)
+        logger.debug(f'Step {step} timed out after {timeout:.1f} seconds.')
+        raise
+    record_latency(step, perf_counter() - start)
+    metrics.record_call('tigerquest', f'wait_{step}', perf_counter() - start)
+    return result
+
+def page_is_idle(driver: webdriver.Chrome) -> bool:
+    '''
+    Returns True once the page has finished loading and has no AJAX requests in progress.
+    '''
+    return driver.execute_script(
+        "return document.readyState === 'complete' && (typeof jQuery === 'undefined' || jQuery.active === 0);"
+    )
+
+def log_latency_summary():
+    '''
+    Logs the number of samples, median, 95th percentile, and histogram for every recorded step.
+    '''
+    for step, samples in sorted(recent_latencies.items()):
+        counts = histograms[step]
+        buckets = ', '.join(f'<={bound}s: {count}' for bound, count in zip(BUCKETS, counts) if count > 0)
+        logger.info(f'Latency for {step}: {sum(counts)} samples, p50 {percentile(samples, 0.5):.2f}s, p95 {percentile(samples, 0.95):.2f}s ({buckets})')
@@ -0,0 +1,89 @@
+'''
+The code in this file compares the prospective members on TigerQuest with the members in the
+Google Sheet and works out what the bot needs to do about each of them. Both lists are indexed
+by normalized email once, so working out the plan takes a single pass over each list no matter
+how large the roster gets.
+
+The Reconciler is given the sheet first, and then the TigerQuest members one at a time as the
+roster is read, so new members can be handled as soon as they are found. Once the roster has
+been read and the inbox has been checked for membership numbers, plan() returns everything else
+the loop needs to do.
+'''
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from members import Member, Status
+from log import logger
+
+REMINDER_AFTER_DAYS = 7 # days after the interest email before a reminder is sent
+REJECT_AFTER_DAYS = 7 # days after the reminder before the application is rejected
+
+@dataclass
+class ActionPlan:
+    '''
+    Everything the bot needs to do in one loop. Members are the ones from the sheet unless
+    noted otherwise.
+    '''
+    accept: list[tuple[Member, Member, str]] = field(default_factory=list) # (sheet member, tigerquest member, membership number)
+    reminders: list[Member] = field(default_factory=list) # members to send a reminder to
+    expired: list[Member] = field(default_factory=list) # members whose time limit has run out
+    conflicts: list[Member] = field(default_factory=list) # members marked as accepted in the sheet who are still on tigerquest
+
+    def summary(self) -> str:
+        return f'{len(self.accept)} to accept, {len(self.reminders)} reminders, {len(self.expired)} expired, {len(self.conflicts)} conflicts'
+
+class Reconciler:
+    '''
+    Builds an ActionPlan from the sheet members and the TigerQuest members.
+    '''
+    def __init__(self, sheet_members: list[Member]):
+        self.sheet_members = sheet_members
+        self.sheet_by_email = {member.key: member for member in sheet_members}
+        self.tq_by_email = {}
+
+    def add_tq_member(self, member: Member) -> bool:
+        '''
+        Records a member found on TigerQuest. Returns True if they are new, meaning they are not in
+        the sheet and have not been seen earlier in the roster.
+        '''
+        is_new = member.key not in self.sheet_by_email and member.key not in self.tq_by_email
+        self.tq_by_email[member.key] = member
+        return is_new
+
+    def accept_candidates(self) -> list[Member]:
+        '''
+        Returns the sheet members that are on TigerQuest and have not been accepted, which are the
+        members whose membership number should be looked for in the inbox.
+        '''
+        return [member for key, member in self.sheet_by_email.items() if key in self.tq_by_email and member.status != Status.ACCEPTED]
+
+    def plan(self, membership_ids: dict[str, str], now: datetime|None = None) -> ActionPlan:
+        '''
+        Returns the plan for this loop, given the membership numbers found in the inbox, keyed by member key.
+        '''
+        now = now or datetime.now()
+        plan = ActionPlan()
+
+        for key, member in self.sheet_by_email.items():
+            tq_member = self.tq_by_email.get(key)
+            status = member.status
+            days = (now - member.status_date).days if member.status_date is not None else None
+
+            if status == Status.ACCEPTED:
+                if tq_member is not None:
+                    # this should not happen unless tigerquest has failed to remove users
+                    plan.conflicts.append(member)
+                continue
+
+            if tq_member is not None and membership_ids.get(key) is not None:
+                plan.accept.append((member, tq_member, membership_ids[key]))
+                continue
+
+            if days is None and status in (Status.EMAIL_SENT, Status.REMINDER_SENT):
+                logger.warning(f'Member {member.name} has an invalid status date, skipping their time limit.')
+            elif status == Status.EMAIL_SENT and days > REMINDER_AFTER_DAYS:
+                plan.reminders.append(member)
+            elif status == Status.REMINDER_SENT and days > REJECT_AFTER_DAYS:
+                plan.expired.append(member)
+
+        return plan
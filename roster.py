@@ -0,0 +1,103 @@
+'''
+The code in this file finds the changes to the TigerQuest roster since the last scrape, so that the
+bot only has to deal with the prospective members who were added or removed.
+
+Each roster page gets a fingerprint: a hash of the set of member profile links on the page together
+with its pagination markers (the pagination text, which holds the total count, and the next page
+link). The fingerprint and the members of every page are saved in the database after each complete
+scrape. When a page has the same fingerprint as last time, its members are taken from the database
+instead of being read again, so a roster that has not changed costs one page load per page and
+nothing else. Saved pages are read again once they are older than the profile cache allows, so
+changes to a member's profile are still picked up.
+
+RosterScan reports the changes as RosterChange events: 'added' as soon as a new member is found, and
+'removed' once the whole roster has been read.
+'''
+
+import hashlib
+import json
+from dataclasses import dataclass
+from time import time
+from typing import Callable
+from log import logger
+from members import Member
+import cache
+import metrics
+import storage
+
+storage.execute('''
+    CREATE TABLE IF NOT EXISTS roster_pages (
+        page_number INTEGER PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        members TEXT NOT NULL,
+        read_at REAL NOT NULL
+    )
+''')
+
+@dataclass(slots=True)
+class RosterChange:
+    '''
+    A prospective member who was added to or removed from the roster since the last scrape.
+    kind is 'added' or 'removed'.
+    '''
+    kind: str
+    member: Member
+
+def page_fingerprint(hrefs: list[str], markers: list[str]) -> str:
+    '''
+    Returns a hash of the set of member profile links on a roster page and its pagination markers.
+    '''
+    return hashlib.sha256(json.dumps([sorted(hrefs), markers]).encode()).hexdigest()
+
+class RosterScan:
+    '''
+    One scrape of the roster. page() is called for each roster page in order, then finish() once the
+    last page has been read, after which members holds the whole roster and changes every change found.
+    '''
+    def __init__(self):
+        self.saved_pages = {}
+        rows = storage.execute('SELECT page_number, fingerprint, members, read_at FROM roster_pages')
+        for page_number, fingerprint, members, read_at in rows:
+            self.saved_pages[page_number] = (fingerprint, [Member.from_dict(values) for values in json.loads(members)], read_at)
+        self.previous = {member.key: member for fingerprint, members, read_at in self.saved_pages.values() for member in members}
+        self.pages = {}
+        self.members = []
+        self.changes = []
+
+    def page(self, page_number: int, hrefs: list[str], markers: list[str], read_members: Callable[[], list[Member]]) -> list[RosterChange]:
+        '''
+        Records a roster page from its profile links and pagination markers. read_members is only
+        called if the page has changed since the last scrape. Returns the members on the page who
+        were not on the roster before.
+        '''
+        fingerprint = page_fingerprint(hrefs, markers)
+        saved = self.saved_pages.get(page_number)
+        if saved is not None and saved[0] == fingerprint and saved[2] > time() - cache.TTL_SECONDS:
+            logger.debug(f'Roster page {page_number} has not changed since the last scrape, skipping it.')
+            metrics.count('roster_pages_unchanged')
+            members, read_at = saved[1], saved[2]
+        else:
+            metrics.count('roster_pages_changed')
+            members, read_at = read_members(), time()
+
+        self.pages[page_number] = (fingerprint, members, read_at)
+        self.members.extend(members)
+        added = [RosterChange('added', member) for member in members if member.key not in self.previous]
+        self.changes.extend(added)
+        return added
+
+    def finish(self) -> list[RosterChange]:
+        '''
+        Saves the pages for the next scrape, and returns the members who are no longer on the roster.
+        '''
+        current = {member.key for member in self.members}
+        removed = [RosterChange('removed', member) for key, member in self.previous.items() if key not in current]
+        self.changes.extend(removed)
+
+        storage.execute('DELETE FROM roster_pages')
+        storage.executemany(
+            'INSERT INTO roster_pages (page_number, fingerprint, members, read_at) VALUES (?, ?, ?, ?)',
+            [(page_number, fingerprint, json.dumps([member.to_dict() for member in members]), read_at) for page_number, (fingerprint, members, read_at) in self.pages.items()]
+        )
+        logger.info(f'Roster has {len(self.members)} prospective members, {len(self.changes) - len(removed)} added and {len(removed)} removed since the last scrape.')
+        return removed
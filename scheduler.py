@@ -0,0 +1,140 @@
+'''
+The code in this file runs the stages of the bot on their own schedules, instead of running
+everything and then sleeping for a fixed amount of time. Each stage has a base interval. When a
+stage runs without finding anything to do, its interval is lengthened (up to a limit), and as
+soon as it does find work it goes back to its base interval.
+
+A wake check can be given to the scheduler, which is called while it is waiting. When the check
+reports a change (a new message in the inbox, for example) the stages that depend on it are run
+straight away instead of waiting for their next turn.
+
+Stages are run from the scheduler's thread, so a stage never overlaps with another run of itself.
+Stages that do not depend on each other can be named in concurrent_stages: when more than one of
+them is due they are run at the same time in their own threads, and the rest of the due stages are
+run one at a time once they have all finished.
+
+The time each stage is next due is saved in the database, so a restart picks up the schedule
+where it left off instead of running every stage at once.
+'''
+
+import threading
+from time import monotonic, perf_counter, sleep, time
+from typing import Callable
+from log import logger
+import metrics
+import storage
+
+class Stage:
+    '''
+    A step of the bot that runs on its own schedule. run is called with no arguments and returns
+    True if it found something to do, which resets the stage to its base interval.
+    '''
+    def __init__(self, name: str, run: Callable[[], bool], interval_minutes: float, max_idle_multiplier: float = 4, backoff_factor: float = 2):
+        self.name = name
+        self.function = run
+        self.base_interval = interval_minutes * 60
+        self.max_interval = self.base_interval * max_idle_multiplier
+        self.backoff_factor = backoff_factor
+        self.interval = self.base_interval
+        self.next_run = 0 # every stage runs once as soon as the scheduler starts, unless it ran recently
+        self.restore_schedule()
+
+    def restore_schedule(self):
+        '''
+        Loads the time the stage was due from before the last restart, if there is one.
+        '''
+        saved = storage.get_value(f'stage_next_run:{self.name}')
+        if saved is not None:
+            remaining = min(self.max_interval, float(saved) - time())
+            self.next_run = monotonic() + max(0, remaining)
+
+    def is_due(self, now: float) -> bool:
+        return now >= self.next_run
+
+    def pull_forward(self):
+        '''
+        Makes the stage due now, and resets it to its base interval.
+        '''
+        self.interval = self.base_interval
+        self.next_run = 0
+
+    def run(self):
+        '''
+        Runs the stage and schedules its next run. An exception in a stage is logged and the stage is
+        tried again after its base interval.
+        '''
+        start = perf_counter()
+        try:
+            with metrics.timer('stage', self.name):
+                found_work = self.function()
+        except Exception:
+            logger.exception(f'An exception occurred in the {self.name} stage.')
+            self.interval = self.base_interval
+        else:
+            if found_work:
+                self.interval = self.base_interval
+            else:
+                self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+        self.next_run = monotonic() + self.interval
+        storage.set_value(f'stage_next_run:{self.name}', str(time() + self.interval))
+        logger.info(f'Stage {self.name} took {perf_counter() - start:.2f} seconds, next run in {self.interval / 60:.1f} minutes.')
+
+class Scheduler:
+    '''
+    Runs the stages in the order they are given whenever they are due, except that the due stages
+    named in concurrent_stages are run together first. While waiting, wake_check is called every
+    poll_seconds, and if it returns True the wake_stages are made due straight away.
+    '''
+    def __init__(self, stages: list[Stage], wake_check: Callable[[], bool]|None = None, wake_stages: list[str]|None = None, poll_seconds: float = 60, concurrent_stages: list[str]|None = None):
+        self.stages = stages
+        self.wake_check = wake_check
+        self.wake_stages = [stage for stage in stages if stage.name in (wake_stages or [])]
+        self.poll_seconds = poll_seconds
+        self.concurrent_stages = [stage for stage in stages if stage.name in (concurrent_stages or [])]
+
+    def run_due_stages(self):
+        '''
+        Runs every stage that is due: the concurrent stages together, then the others in order.
+        '''
+        together = [stage for stage in self.concurrent_stages if stage.is_due(monotonic())]
+        if len(together) > 1:
+            start = perf_counter()
+            threads = [threading.Thread(target=stage.run, name=f'Stage-{stage.name}') for stage in together]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            logger.info(f'Stages {", ".join(stage.name for stage in together)} took {perf_counter() - start:.2f} seconds together.')
+        elif len(together) == 1:
+            together[0].run()
+
+        for stage in self.stages:
+            if stage not in together and stage.is_due(monotonic()):
+                stage.run()
+
+    def wait(self):
+        '''
+        Sleeps until the next stage is due or the wake check reports a change.
+        '''
+        next_run = min(stage.next_run for stage in self.stages)
+        logger.debug(f'Waiting {max(0, next_run - monotonic()) / 60:.1f} minutes for the next stage.')
+        while monotonic() < next_run:
+            sleep(min(self.poll_seconds, max(0, next_run - monotonic())))
+            if self.wake_check is None or monotonic() >= next_run:
+                continue
+            try:
+                woken = self.wake_check()
+            except Exception:
+                logger.exception('The scheduler wake check failed.')
+                continue
+            if woken:
+                logger.info(f'Change detected, running {", ".join(stage.name for stage in self.wake_stages)} now.')
+                for stage in self.wake_stages:
+                    stage.pull_forward()
+                return
+
+    def run_forever(self):
+        while True:
+            self.run_due_stages()
+            metrics.end_cycle()
+            self.wait()
@@ -7,9 +7,13 @@ The sheet in question should be the current year's IEEE Membership sheet.
 '''
 
 from datetime import datetime
+from bisect import bisect_left
+import threading
 import gspread
 from log import logger
 from settings import settings
+from members import Member, Status, normalize_email, parse_status_date
+import metrics
 
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
@@ -19,120 +23,297 @@ def get_spreadsheet_id() -> str:
     '''
     return settings['GoogleSheets']['spreadsheet_id']
 
+def open_worksheet() -> gspread.Worksheet:
+    '''
+    Opens the current year's IEEE membership sheet through the Google Sheets API.
+    '''
+    with metrics.timer('sheets', 'open'):
+        gc = gspread.oauth(credentials_filename='credentials.json')
+        return gc.open_by_key(get_spreadsheet_id()).worksheet('Sheet1')
+
+# called to open the worksheet, can be replaced with anything that behaves like a gspread worksheet (such as fakes.FakeWorksheet)
+worksheet_factory = open_worksheet
+# the authenticated worksheet is opened once and reused, gspread refreshes its access token as needed
+worksheet = None
+
 def get_worksheet() -> gspread.Worksheet:
     '''
     Gets the worksheet that represents the current year's IEEE membership sheet.
     '''
-    gc = gspread.oauth(credentials_filename='credentials.json')
-    return gc.open_by_key(get_spreadsheet_id()).worksheet('Sheet1')
+    global worksheet
+    if worksheet is None:
+        worksheet = worksheet_factory()
+    return worksheet
 
-def get_list_of_known_members() -> list[dict[str, str]]:
+class SheetSnapshot:
     '''
-    Gets a list of all the members in the current year's IEEE membership sheet.
+    A copy of the member columns (A to E) of the sheet, read in a single request. Each attribute is a
+    column with one entry per member in sheet order, and rows holds the sheet row number of each member.
+    '''
+    def __init__(self, values: list[list[str]]):
+        self.rows = []
+        self.names = []
+        self.emails = []
+        self.membership_ids = []
+        self.statuses = []
+        self.status_dates = []
+        self.last_row = len(values) # the last row of the sheet that has anything in it
+
+        # skip the header row and any blank rows
+        for row_number, row in enumerate(values[1:], start=2):
+            row = row + [''] * (5 - len(row))
+            if row[0] == '' and row[1] == '':
+                continue
+            self.rows.append(row_number)
+            self.names.append(row[0])
+            self.emails.append(row[1])
+            self.membership_ids.append(row[2])
+            self.statuses.append(row[3])
+            self.status_dates.append(row[4])
 
-    Returns a list of dictionaries, where each dictionary contains the attributes 'name', 'email', 'status', and 'status_date'.
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def to_members(self) -> list[Member]:
+        '''
+        Returns a Member for every row, with their name, email, membership id, status, status date, and sheet row.
+        '''
+        member_info = []
+        for row, name, email, membership_id, status, status_date in zip(self.rows, self.names, self.emails, self.membership_ids, self.statuses, self.status_dates):
+            member_info.append(Member(
+                name,
+                email,
+                status=Status.parse(status),
+                status_date=parse_status_date(status_date),
+                membership_id=membership_id,
+                sheet_row=row
+            ))
+        return member_info
+
+def get_snapshot() -> SheetSnapshot:
     '''
-    logger.debug('Getting list of known members...')
+    Reads the member columns of the current year's IEEE membership sheet in a single request.
+    Any changes waiting in the write buffer are sent first so that the snapshot includes them.
+    '''
+    with lock:
+        flush()
+        with metrics.timer('sheets', 'get_values'):
+            snapshot = SheetSnapshot(get_worksheet().get_values('A:E'))
+        rebuild_row_index(snapshot)
+    return snapshot
 
-    # connect to google sheets and get the worksheet
-    worksheet = get_worksheet()
-    names_list = worksheet.col_values(1)[1:]
-    emails_list = worksheet.col_values(2)[1:]
-    status_list = worksheet.col_values(4)[1:]
-    status_dates_list = worksheet.col_values(5)[1:]
-    
-    # create a list of dictionaries, where each dictionary contains the attributes 'name', 'email', 'status', and 'status_date'
-    member_info = []
-    for names, emails, status, status_dates in zip(names_list, emails_list, status_list, status_dates_list):
-        member_info.append({
-            'name': names,
-            'email': emails,
-            'status': status,
-            'status_date': status_dates
-        })
+def get_list_of_known_members() -> list[Member]:
+    '''
+    Gets a list of all the members in the current year's IEEE membership sheet.
+    '''
+    logger.debug('Getting list of known members...')
+    member_info = get_snapshot().to_members()
     logger.debug(f'Found known members: {str(member_info)}')
     return member_info
 
-def add_prospective_member_to_sheet(member: dict[str, str]):
+# normalized email -> sheet row of that member, kept in step with the sheet as rows are added and deleted
+row_index = {}
+# the last row of the sheet that has anything in it
+last_row = 1
+
+def rebuild_row_index(snapshot: SheetSnapshot):
     '''
-    Takes a new prospective member and adds them to the current year's IEEE membership sheet.
+    Replaces the row index with the rows from a fresh snapshot of the sheet.
+    '''
+    global last_row
+    row_index.clear()
+    for row, email in zip(snapshot.rows, snapshot.emails):
+        row_index[normalize_email(email)] = row
+    last_row = snapshot.last_row
+
+class SheetWriteBuffer:
+    '''
+    Collects every change made to the sheet during a loop so that they can be sent together in a
+    few requests when flush is called, instead of one request per cell.
 
-    The member should be a dictionary with the attributes 'name', 'email'. The member
-    will be given the status 'EMAIL SENT' with the current date.
+    Changes to existing members are recorded by their key (normalized email) and matched to sheet rows using the row
+    index when the buffer is flushed.
     '''
-    # connect to google sheets and get the worksheet
-    worksheet = get_worksheet()
+    def __init__(self):
+        self.appends = [] # new rows to add at the bottom of the sheet
+        self.updates = {} # normalized email -> {column: new value}
+        self.deletions = set() # normalized emails of the rows to delete
 
-    # get the current date
-    current_date = datetime.now().strftime('%m/%d/%y')
+    def __len__(self) -> int:
+        return len(self.appends) + len(self.updates) + len(self.deletions)
 
-    # add the new member to the sheet
-    if settings.get('Debug') != True:
-        worksheet.append_row([member['name'], member['email'], '', 'EMAIL SENT', current_date], table_range='A1:E1')
+    def find_append(self, key: str) -> list[str]|None:
+        for values in self.appends:
+            if normalize_email(values[1]) == key:
+                return values
+        return None
+
+    def append_row(self, values: list[str]):
+        self.appends.append(values)
+
+    def update_cells(self, key: str, values: dict[int, str]):
+        # a member added during this loop has not been written yet, so just change their new row
+        pending = self.find_append(key)
+        if pending is not None:
+            for column, value in values.items():
+                pending[column - 1] = value
+        else:
+            self.updates.setdefault(key, {}).update(values)
+
+    def delete_row(self, key: str):
+        pending = self.find_append(key)
+        if pending is not None:
+            self.appends.remove(pending)
+        else:
+            self.updates.pop(key, None)
+            self.deletions.add(key)
+
+    def resolve_rows(self, worksheet: gspread.Worksheet) -> dict[str, int]:
+        '''
+        Returns the sheet row of every member with a change waiting. The rows are checked against the
+        sheet in one request, and if the index has drifted from the sheet (because someone edited it
+        by hand, for example) the index is rebuilt first.
+        '''
+        keys = list(self.updates.keys() | self.deletions)
+        if len(keys) == 0:
+            return {}
 
-    logger.debug(f'Added new member {member["name"]} to sheet.')
+        drifted = any(key not in row_index for key in keys)
+        if not drifted:
+            with metrics.timer('sheets', 'batch_get'):
+                found = worksheet.batch_get([f'B{row_index[key]}' for key in keys])
+            drifted = any(normalize_email(value[0][0] if value and value[0] else '') != key for key, value in zip(keys, found))
+        if drifted:
+            logger.warning('Sheet row index does not match the sheet, rebuilding it.')
+            with metrics.timer('sheets', 'get_values'):
+                rebuild_row_index(SheetSnapshot(worksheet.get_values('A:E')))
 
-def update_member_status(member: dict[str, str], new_status: str):
+        rows = {}
+        for key in keys:
+            if key in row_index:
+                rows[key] = row_index[key]
+            else:
+                logger.error(f'Could not find {key} in the sheet, skipping changes to their row.')
+        return rows
+
+    def flush(self, worksheet: gspread.Worksheet):
+        '''
+        Sends all of the collected changes to the sheet. Cell updates are sent first, while the row
+        numbers are still valid, then rows are deleted from the bottom up so each deletion does not
+        move the rows still to be deleted, and finally the new rows are appended. The row index is
+        then updated to match.
+        '''
+        global last_row
+        if len(self) == 0:
+            return
+        logger.debug(f'Writing {len(self.updates)} row updates, {len(self.deletions)} deletions, and {len(self.appends)} new rows to the sheet.')
+
+        if settings.get('Debug') != True:
+            rows = self.resolve_rows(worksheet)
+
+            updates = [
+                {'range': gspread.utils.rowcol_to_a1(rows[key], column), 'values': [[value]]}
+                for key, values in self.updates.items() if key in rows
+                for column, value in values.items()
+            ]
+            if len(updates) > 0:
+                with metrics.timer('sheets', 'batch_update'):
+                    worksheet.batch_update(updates, value_input_option='USER_ENTERED')
+
+            deleted_rows = sorted(rows[key] for key in self.deletions if key in rows)
+            if len(deleted_rows) > 0:
+                with metrics.timer('sheets', 'delete_rows'):
+                    worksheet.spreadsheet.batch_update({'requests': [
+                        {'deleteDimension': {'range': {'sheetId': worksheet.id, 'dimension': 'ROWS', 'startIndex': row - 1, 'endIndex': row}}}
+                        for row in reversed(deleted_rows)
+                    ]})
+
+            if len(self.appends) > 0:
+                with metrics.timer('sheets', 'append_rows'):
+                    worksheet.append_rows(self.appends, table_range='A1:E1')
+
+            # move the index to match: deleted rows are dropped and the rows below them shift up, then new rows go on the end
+            for key in self.deletions:
+                row_index.pop(key, None)
+            for key, row in row_index.items():
+                row_index[key] = row - bisect_left(deleted_rows, row)
+            last_row -= len(deleted_rows)
+            for values in self.appends:
+                last_row += 1
+                row_index[normalize_email(values[1])] = last_row
+
+        self.appends = []
+        self.updates = {}
+        self.deletions = set()
+
+# changes made during the current loop that have not been sent to the sheet yet
+write_buffer = SheetWriteBuffer()
+# held while the write buffer or the row index is used, since stages can run at the same time in different threads
+lock = threading.RLock()
+
+def flush():
     '''
-    Takes a member and a new status, and updates the status of the member in the current year's IEEE membership sheet.
+    Sends any changes waiting in the write buffer to the sheet.
+    '''
+    with lock:
+        write_buffer.flush(get_worksheet())
 
-    The member should be a dictionary with the attributes 'name', 'email'. The new_status should be a string.
+def add_prospective_member_to_sheet(member: Member):
     '''
-    # connect to google sheets and get the worksheet
-    worksheet = get_worksheet()
+    Takes a new prospective member and adds them to the current year's IEEE membership sheet.
 
-    # get the current date
-    current_date = datetime.now().strftime('%m/%d/%y')
+    The member will be given the status 'EMAIL SENT' with the current date.
+    The row is added the next time the sheet is flushed.
+    '''
+    member.status = Status.EMAIL_SENT
+    member.status_date = datetime.now()
+
+    # add the new member to the sheet
+    with lock:
+        write_buffer.append_row([member.name, member.email, '', member.status, member.status_date_text])
+
+    logger.debug(f'Added new member {member.name} to sheet.')
+
+def update_member_status(member: Member, new_status: Status):
+    '''
+    Takes a member and a new status, and updates the status of the member in the current year's IEEE membership sheet.
+    The change is made the next time the sheet is flushed.
+    '''
+    member.status = new_status
+    member.status_date = datetime.now()
 
     # update the status of the member in the sheet
-    cell = worksheet.find(member['email'])
-    member_row = cell.row
-    if settings.get('Debug') != True:
-        worksheet.update_cell(member_row, 4, new_status)
-        worksheet.update_cell(member_row, 5, current_date)
+    with lock:
+        write_buffer.update_cells(member.key, {4: member.status, 5: member.status_date_text})
 
-    logger.debug(f'Updated member status of {member["name"]} to {new_status} in the sheet.')
+    logger.debug(f'Updated member status of {member.name} to {new_status} in the sheet.')
 
-def member_approved(member: dict[str, str], member_id: str):
+def member_approved(member: Member, member_id: str):
     '''
     Updates the status of the member to 'APPROVED' and adds their membership ID to the members sheet.
-
-    Member should be a dictionary with the attributes 'name', 'email'. member_id should be a string.
+    The change is made the next time the sheet is flushed.
     '''
-    # connect to google sheets and get the worksheet
-    worksheet = get_worksheet()
-
-    # get the current date
-    current_date = datetime.now().strftime('%m/%d/%y')
+    member.membership_id = member_id
+    member.status = Status.APPROVED
+    member.status_date = datetime.now()
 
     # update the status of the member in the sheet
-    cell = worksheet.find(member['email'])
-    member_row = cell.row
-    if settings.get('Debug') != True:
-        worksheet.update_cell(member_row, 3, member_id)
-        worksheet.update_cell(member_row, 4, 'APPROVED')
-        worksheet.update_cell(member_row, 5, current_date)
+    with lock:
+        write_buffer.update_cells(member.key, {3: member_id, 4: member.status, 5: member.status_date_text})
 
-    logger.debug(f'Updated member status of {member["name"]} to APPROVED in the sheet with id {member_id}.')
+    logger.debug(f'Updated member status of {member.name} to APPROVED in the sheet with id {member_id}.')
 
-def remove_member(member: dict[str, str]):
+def remove_member(member: Member):
     '''
     Remove member from members sheet.
-
-    Member should be a dictionary with the attributes 'name', 'email'.
+    The row is deleted the next time the sheet is flushed.
     '''
-    # connect to google sheets and get the worksheet
-    worksheet = get_worksheet()
-
-    # update the status of the member in the sheet
-    cell = worksheet.find(member['email'])
-    member_row = cell.row
-    if settings.get('Debug') != True:
-        worksheet.delete_rows(member_row, member_row)
+    with lock:
+        write_buffer.delete_row(member.key)
 
-    logger.debug(f'Removed member {member["name"]} from sheet.')
+    logger.debug(f'Removed member {member.name} from sheet.')
 
-# add_prospective_member_to_sheet({'name': 'David Bootle', 'email': 'dbootle@clemson.edu'})
-# update_member_status({'name': 'David Bootle', 'email': 'dbootle@clemson.edu'}, 'REMINDER SENT')
-# member_approved({'name': 'David Bootle', 'email': 'dbootle@clemson.edu'}, '123456789')
-# remove_member({'name': 'David Bootle', 'email': 'dbootle@clemson.edu'})
\ No newline at end of file
+# add_prospective_member_to_sheet(Member('David Bootle', 'dbootle@clemson.edu'))
+# update_member_status(Member('David Bootle', 'dbootle@clemson.edu'), Status.REMINDER_SENT)
+# member_approved(Member('David Bootle', 'dbootle@clemson.edu'), '123456789')
+# remove_member(Member('David Bootle', 'dbootle@clemson.edu'))
\ No newline at end of file
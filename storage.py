@@ -0,0 +1,60 @@
+'''
+The functions in this file manage the local SQLite database that the bot uses to remember
+information between loops and between restarts. Each feature that needs to store something
+creates its own table in the same database file.
+'''
+
+import sqlite3
+import threading
+from settings import settings
+
+DATABASE_FILE = settings.get('System', {}).get('database_file', 'registration.db')
+
+# sqlite connections cannot be used by two threads at once, so every query holds this lock
+lock = threading.RLock()
+connection = None
+
+def get_connection() -> sqlite3.Connection:
+    '''
+    Opens the database the first time it is needed and returns the shared connection.
+    '''
+    global connection
+    with lock:
+        if connection is None:
+            connection = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+def execute(sql: str, parameters: tuple|dict = ()) -> list[tuple]:
+    '''
+    Runs a single statement, commits it, and returns any rows it produced.
+    '''
+    with lock:
+        db = get_connection()
+        with db:
+            return db.execute(sql, parameters).fetchall()
+
+def executemany(sql: str, parameters: list[tuple]):
+    '''
+    Runs a statement once for each set of parameters in a single transaction.
+    '''
+    with lock:
+        db = get_connection()
+        with db:
+            db.executemany(sql, parameters)
+
+# small values that need to survive a restart, such as checkpoints, are kept in this table
+execute('CREATE TABLE IF NOT EXISTS saved_values (key TEXT PRIMARY KEY, value TEXT)')
+
+def get_value(key: str, default: str|None = None) -> str|None:
+    '''
+    Returns a single saved value, or default if nothing has been saved under the key.
+    '''
+    rows = execute('SELECT value FROM saved_values WHERE key = ?', (key,))
+    return rows[0][0] if rows else default
+
+def set_value(key: str, value: str):
+    '''
+    Saves a single value under the key, replacing any previous value.
+    '''
+    execute('INSERT OR REPLACE INTO saved_values (key, value) VALUES (?, ?)', (key, value))
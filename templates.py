@@ -0,0 +1,110 @@
+'''
+The functions in this file load the email templates in the emails folder. Each template is read
+and split into its text and placeholders once, so filling one in for a member is a single join
+instead of reading the file and running a replace for every placeholder.
+
+Placeholders are written as %NAME% (or %%NAME%% in the critical email). A template that uses a
+placeholder the bot does not know about is rejected when it is loaded. Templates are reloaded
+automatically when their file changes.
+'''
+
+import os
+import re
+from time import monotonic
+from log import logger
+
+EMAILS_FOLDER = 'emails'
+PLACEHOLDER_PATTERN = re.compile(r'%%([A-Z_]+)%%|%([A-Z_]+)%')
+KNOWN_PLACEHOLDERS = {'FIRST_NAME', 'PRESIDENT_NAME', 'MESSAGE'}
+RELOAD_CHECK_SECONDS = 5 # how often to check whether a template file has changed
+
+class Template:
+    '''
+    A parsed email template. parts holds the text of the template with None in the place of each
+    placeholder, and placeholders holds the placeholder names at the same positions.
+    '''
+    def __init__(self, name: str, path: str, mtime: float, parts: list[str|None], placeholders: dict[int, str]):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.parts = parts
+        self.placeholders = placeholders
+        self.checked_at = monotonic()
+
+    def render(self, values: dict[str, str]) -> str:
+        '''
+        Returns the template with each placeholder replaced by its value.
+        '''
+        parts = self.parts.copy()
+        for index, placeholder in self.placeholders.items():
+            parts[index] = values[placeholder]
+        return ''.join(parts)
+
+# template name -> Template
+loaded = {}
+
+def parse_template(name: str, path: str) -> Template:
+    '''
+    Reads a template file and splits it into text and placeholders.
+    Raises ValueError if it uses a placeholder that the bot does not fill in.
+    '''
+    mtime = os.stat(path).st_mtime
+    with open(path, 'r') as f:
+        text = f.read()
+
+    parts = []
+    placeholders = {}
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        placeholder = match.group(1) or match.group(2)
+        if placeholder not in KNOWN_PLACEHOLDERS:
+            raise ValueError(f'Email template {path} uses unknown placeholder {match.group(0)}.')
+        parts.append(text[position:match.start()])
+        placeholders[len(parts)] = placeholder
+        parts.append(None)
+        position = match.end()
+    parts.append(text[position:])
+
+    logger.debug(f'Loaded email template {name} with placeholders {sorted(set(placeholders.values()))}.')
+    return Template(name, path, mtime, parts, placeholders)
+
+def load_all():
+    '''
+    Loads every template in the emails folder.
+    '''
+    for filename in sorted(os.listdir(EMAILS_FOLDER)):
+        name, extension = os.path.splitext(filename)
+        if extension == '.html':
+            loaded[name] = parse_template(name, os.path.join(EMAILS_FOLDER, filename))
+
+def get_template(name: str) -> Template:
+    '''
+    Returns the parsed template, reloading it first if its file has changed.
+    '''
+    template = loaded.get(name)
+    if template is None:
+        template = loaded[name] = parse_template(name, os.path.join(EMAILS_FOLDER, f'{name}.html'))
+    elif monotonic() - template.checked_at > RELOAD_CHECK_SECONDS:
+        template.checked_at = monotonic()
+        if os.stat(template.path).st_mtime != template.mtime:
+            logger.info(f'Email template {name} changed, reloading it.')
+            try:
+                template = loaded[name] = parse_template(name, template.path)
+            except ValueError:
+                logger.exception(f'Failed to reload email template {name}, continuing to use the previous version.')
+    return template
+
+def render(name: str, values: dict[str, str]) -> str:
+    '''
+    Fills in the named template with the given placeholder values.
+    '''
+    return get_template(name).render(values)
+
+def render_many(name: str, values_list: list[dict[str, str]]) -> list[str]:
+    '''
+    Fills in the named template once for each set of placeholder values.
+    '''
+    template = get_template(name)
+    return [template.render(values) for values in values_list]
+
+load_all()
@@ -0,0 +1,50 @@
+'''
+The bot reads auth.toml and the email templates from the current folder when its modules are
+imported, so the tests are run from a temporary folder with a minimal auth.toml and a copy of the templates.
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = '''Debug = false
+
+[System]
+database_file = 'tests.db'
+
+[Metrics]
+port = 0
+jsonl_file = ''
+
+[ClemsonAuth]
+login_domain = 'login.invalid'
+username = ''
+password = ''
+
+[GoogleSheets]
+spreadsheet_id = 'tests'
+
+[Gmail]
+president_name = 'Test President'
+sends_per_second = 1000
+send_burst = 1000
+send_retry_minutes = 0
+
+[SeleniumDriver]
+path = ''
+
+[TigerQuest]
+prospective_member_url = 'http://127.0.0.1:1/roster'
+approve_member_url = 'http://127.0.0.1:1/approve/'
+reject_member_url = 'http://127.0.0.1:1/deny/'
+'''
+
+folder = tempfile.mkdtemp(prefix='tigerquest-tests-')
+with open(os.path.join(folder, 'auth.toml'), 'w') as f:
+    f.write(SETTINGS)
+shutil.copytree(os.path.join(REPO_FOLDER, 'emails'), os.path.join(folder, 'emails'))
+os.chdir(folder)
+sys.path.insert(0, REPO_FOLDER)
@@ -0,0 +1,44 @@
+import asyncio
+import queue
+from datetime import datetime
+import fakes
+import gmail
+import main as bot
+
+HEADER = ['Name', 'Email', 'Membership ID', 'Status', 'Status Date']
+
+def test_cycles_share_a_bounded_pool_of_clients(monkeypatch):
+    today = datetime.now().strftime('%m/%d/%y')
+    mailbox = fakes.FakeGmail(latency=0)
+    worksheet = fakes.FakeWorksheet([HEADER, ['Pending Member', 'pending@clemson.edu', '', 'EMAIL SENT', today]], latency=0, quota_per_minute=None)
+    monkeypatch.setattr(gmail, 'client_factory', lambda: mailbox)
+    monkeypatch.setattr(gmail, 'idle_clients', queue.Queue())
+    monkeypatch.setattr(gmail, 'client_stats', {'built': 0, 'reused': 0, 'build_seconds': 0.0})
+    monkeypatch.setattr(bot.sheets, 'worksheet_factory', lambda: worksheet)
+    monkeypatch.setattr(bot.sheets, 'worksheet', None)
+    monkeypatch.setattr(bot, 'scrape_roster_async', lambda sheet_synced: sheet_synced)
+    bot.storage.set_value('inbox_last_scan_time', '0')
+
+    asyncio.run(bot.run_cycle())
+    built = gmail.client_stats['built']
+    for cycle in range(3):
+        asyncio.run(bot.run_cycle())
+
+    # every stage runs on a new thread each cycle, but later cycles reuse the clients already built
+    assert 1 <= built <= gmail.POOL_SIZE
+    assert gmail.client_stats['built'] == built
+    assert gmail.client_stats['reused'] > 0
+    assert gmail.idle_clients.qsize() == built
+
+def test_scan_finds_archived_replies_but_skips_sent_mail(monkeypatch):
+    mailbox = fakes.FakeGmail(latency=0)
+    monkeypatch.setattr(gmail, 'client_factory', lambda: mailbox)
+    monkeypatch.setattr(gmail, 'idle_clients', queue.Queue())
+    gmail.storage.set_value('inbox_last_scan_time', '0')
+    mailbox.add_message('archived@clemson.edu', 'ieeesb@g.clemson.edu', 'Re: IEEE', 'My number is 123456789.\n', label='ARCHIVE')
+    mailbox.add_message('ieeesb@g.clemson.edu', 'someone@clemson.edu', 'Welcome', 'Your number is 987654321.\n', label='SENT')
+
+    assert gmail.scan_new_messages()
+    assert gmail.membership_ids_by_sender['archived@clemson.edu'] == '123456789'
+    assert 'ieeesb@g.clemson.edu' not in gmail.membership_ids_by_sender
+    assert mailbox.calls['messages.get'] == 1
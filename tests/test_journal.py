@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import fakes
+import journal
+import main as bot
+import sheets
+import storage
+from members import Member
+
+HEADER = ['Name', 'Email', 'Membership ID', 'Status', 'Status Date']
+
+class Crash(Exception):
+    pass
+
+@pytest.fixture
+def bot_world(monkeypatch):
+    '''
+    Plugs the bot into a fake sheet, records the emails it queues and the members it accepts and
+    rejects on TigerQuest, and starts from an empty journal.
+    '''
+    world = SimpleNamespace(
+        worksheet=fakes.FakeWorksheet([HEADER], latency=0, quota_per_minute=None),
+        emails=[],
+        accepted=[],
+        rejected=[],
+    )
+    monkeypatch.setattr(sheets, 'worksheet_factory', lambda: world.worksheet)
+    monkeypatch.setattr(sheets, 'worksheet', None)
+    monkeypatch.setattr(sheets, 'write_buffer', sheets.SheetWriteBuffer())
+    monkeypatch.setattr(bot, 'state', bot.BotState())
+    monkeypatch.setattr(bot, 'browser', SimpleNamespace(acquire=lambda: None))
+    for template in ('interest', 'reminder', 'welcome', 'rejection'):
+        monkeypatch.setattr(bot.gmail, f'send_{template}_email', lambda member, template=template: world.emails.append((template, member.email)))
+    monkeypatch.setattr(bot.webscraper, 'accept_members', lambda driver, members: world.accepted.extend(member.email for member in members))
+    monkeypatch.setattr(bot.webscraper, 'reject_members', lambda driver, members: world.rejected.extend(member.email for member in members))
+    storage.execute('DELETE FROM actions')
+    storage.execute('DELETE FROM action_effects')
+    storage.execute("DELETE FROM saved_values WHERE key = 'roster_snapshot'")
+    journal.waiting_for_flush.clear()
+    return world
+
+def crash(monkeypatch):
+    '''
+    Loses everything the bot was holding in memory, as if it had stopped before flushing the sheet.
+    '''
+    monkeypatch.setattr(sheets, 'write_buffer', sheets.SheetWriteBuffer())
+    monkeypatch.setattr(bot, 'state', bot.BotState())
+    journal.waiting_for_flush.clear()
+
+def sheet_rows(world) -> list[list[str]]:
+    return world.worksheet.values[1:]
+
+def tq_member(email: str) -> Member:
+    return Member('Test Member', email, page_id=email)
+
+def test_new_member_interrupted_before_the_flush_is_added_once(bot_world, monkeypatch):
+    bot.sync_sheet()
+    bot.handle_new_member(tq_member('new@clemson.edu'))
+    crash(monkeypatch)
+
+    bot.recover()
+    bot.recover()
+
+    assert bot_world.emails == [('interest', 'new@clemson.edu')]
+    assert [row[1] for row in sheet_rows(bot_world)] == ['new@clemson.edu']
+    assert journal.pending() == []
+
+def test_deleted_row_is_added_back_without_another_email(bot_world):
+    bot.sync_sheet()
+    bot.handle_new_member(tq_member('new@clemson.edu'))
+    bot.flush_sheet()
+
+    # an officer deletes the row by hand, and the member is still on the roster
+    del bot_world.worksheet.values[1]
+    bot.sync_sheet()
+    bot.handle_new_member(tq_member('new@clemson.edu'))
+    bot.flush_sheet()
+
+    assert bot_world.emails == [('interest', 'new@clemson.edu')]
+    assert [row[1:4] for row in sheet_rows(bot_world)] == [['new@clemson.edu', '', 'EMAIL SENT']]
+
+def test_accept_interrupted_on_tigerquest_is_finished_once(bot_world, monkeypatch):
+    today = datetime.now().strftime('%m/%d/%y')
+    bot_world.worksheet.values.append(['Test Member', 'pending@clemson.edu', '', 'EMAIL SENT', today])
+    bot.set_tq_members([tq_member('pending@g.clemson.edu')])
+    monkeypatch.setattr(bot.gmail, 'get_membership_ids', lambda members, scan_new: {'pending@clemson.edu': '123456789'})
+    def fail(driver, members):
+        raise Crash()
+    monkeypatch.setattr(bot.webscraper, 'accept_members', fail)
+    with pytest.raises(Crash):
+        bot.scan_inbox()
+    crash(monkeypatch)
+    monkeypatch.setattr(bot.webscraper, 'accept_members', lambda driver, members: bot_world.accepted.extend(member.email for member in members))
+
+    bot.recover()
+    bot.recover()
+
+    assert bot_world.emails == [('welcome', 'pending@clemson.edu')]
+    assert bot_world.accepted == ['pending@g.clemson.edu']
+    assert [row[1:4] for row in sheet_rows(bot_world)] == [['pending@clemson.edu', '123456789', 'APPROVED']]
+    assert journal.pending() == []
+
+def test_reject_interrupted_on_tigerquest_is_finished_once(bot_world, monkeypatch):
+    week_ago = (datetime.now() - timedelta(days=8)).strftime('%m/%d/%y')
+    bot_world.worksheet.values.append(['Test Member', 'expired@clemson.edu', '', 'REMINDER SENT', week_ago])
+    bot_world.worksheet.values.append(['Other Member', 'other@clemson.edu', '', 'APPROVED', week_ago])
+    bot.set_tq_members([tq_member('expired@clemson.edu')])
+    def fail(driver, members):
+        raise Crash()
+    monkeypatch.setattr(bot.webscraper, 'reject_members', fail)
+    with pytest.raises(Crash):
+        bot.sweep_time_limits()
+    crash(monkeypatch)
+    monkeypatch.setattr(bot.webscraper, 'reject_members', lambda driver, members: bot_world.rejected.extend(member.email for member in members))
+
+    bot.recover()
+    bot.recover()
+
+    assert bot_world.emails == [('rejection', 'expired@clemson.edu')]
+    assert bot_world.rejected == ['expired@clemson.edu']
+    assert [row[1] for row in sheet_rows(bot_world)] == ['other@clemson.edu']
+    assert journal.pending() == []
+
+def test_buffered_effects_are_only_done_once_flushed(bot_world):
+    action = journal.begin('test:flush', 'test', {})
+    calls = []
+    action.effect('sheet', lambda: calls.append('sheet'), buffered=True)
+    action.finish()
+
+    assert [pending.key for pending in journal.pending()] == ['test:flush']
+    assert journal.pending()[0].done == set()
+    with journal.flush_lock:
+        journal.flushed()
+    assert journal.pending() == []
+    assert journal.begin('test:flush', 'test', {}) is None
+    assert calls == ['sheet']
@@ -0,0 +1,39 @@
+from time import monotonic
+import storage
+from outbox import Outbox
+
+def failed_counts() -> list[int]:
+    return [row[0] for row in storage.execute("SELECT failed FROM outbox WHERE kind = 'test'")]
+
+def test_failed_jobs_are_retried_with_backoff():
+    attempts = []
+    def handler(payload):
+        attempts.append(payload['n'])
+        if len(attempts) < 3:
+            raise RuntimeError('Gmail is down')
+    outbox = Outbox({'test': handler}, workers=1, rate=1000, burst=1000, max_attempts=1, retry_seconds=10, max_retry_seconds=15)
+
+    outbox.enqueue('test', {'n': 1})
+    outbox.wait()
+    assert failed_counts() == [1]
+    (job_id, retry_at), = outbox.retry_at.items()
+    assert 9 < retry_at - monotonic() <= 10
+
+    # nothing is queued again until the wait is over
+    outbox.retry_failed()
+    outbox.wait()
+    assert attempts == [1]
+
+    outbox.retry_at[job_id] = 0
+    outbox.retry_failed()
+    outbox.wait()
+    assert failed_counts() == [2]
+    # the wait doubles after each failure, up to max_retry_seconds
+    assert 14 < outbox.retry_at[job_id] - monotonic() <= 15
+
+    outbox.retry_at[job_id] = 0
+    outbox.retry_failed()
+    outbox.wait()
+    assert attempts == [1, 1, 1]
+    assert failed_counts() == []
+    assert outbox.retry_at == {}
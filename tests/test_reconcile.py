@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from members import Member, Status
+from reconcile import Reconciler
+
+NOW = datetime(2026, 3, 20, 12, 0)
+
+def sheet_member(email: str, status: Status, days_ago: int|None = 0) -> Member:
+    status_date = NOW - timedelta(days=days_ago) if days_ago is not None else None
+    return Member(email.split('@')[0], email, status=status, status_date=status_date)
+
+def tq_member(email: str) -> Member:
+    return Member(email.split('@')[0], email, page_id=email)
+
+def reconcile(sheet: list[Member], tigerquest: list[Member]) -> Reconciler:
+    reconciler = Reconciler(sheet)
+    for member in tigerquest:
+        reconciler.add_tq_member(member)
+    return reconciler
+
+def test_new_members_are_the_ones_not_in_the_sheet():
+    reconciler = Reconciler([sheet_member('known@clemson.edu', Status.EMAIL_SENT)])
+    assert reconciler.add_tq_member(tq_member('new@clemson.edu'))
+    assert not reconciler.add_tq_member(tq_member('new@clemson.edu'))
+    assert not reconciler.add_tq_member(tq_member('known@clemson.edu'))
+    # the @g.clemson.edu form of an address is the same member
+    assert not reconciler.add_tq_member(tq_member('KNOWN@g.clemson.edu'))
+
+def test_accepts_members_who_sent_a_membership_number():
+    waiting = sheet_member('waiting@clemson.edu', Status.EMAIL_SENT)
+    replied = sheet_member('replied@clemson.edu', Status.REMINDER_SENT)
+    gone = sheet_member('gone@clemson.edu', Status.EMAIL_SENT)
+    reconciler = reconcile([waiting, replied, gone], [tq_member('waiting@clemson.edu'), tq_member('replied@g.clemson.edu')])
+
+    plan = reconciler.plan({'replied@clemson.edu': '123456789', 'gone@clemson.edu': '987654321'}, NOW)
+
+    assert [(member, membership_id) for member, _, membership_id in plan.accept] == [(replied, '123456789')]
+    assert plan.accept[0][1].email == 'replied@g.clemson.edu'
+
+def test_time_limits():
+    members = [
+        sheet_member('fresh@clemson.edu', Status.EMAIL_SENT, 7),
+        sheet_member('remind@clemson.edu', Status.EMAIL_SENT, 8),
+        sheet_member('reminded@clemson.edu', Status.REMINDER_SENT, 7),
+        sheet_member('expired@clemson.edu', Status.REMINDER_SENT, 8),
+        sheet_member('approved@clemson.edu', Status.APPROVED, 30),
+        sheet_member('undated@clemson.edu', Status.EMAIL_SENT, None),
+    ]
+    reconciler = reconcile(members, [tq_member(member.email) for member in members])
+
+    plan = reconciler.plan({}, NOW)
+
+    assert [member.email for member in plan.reminders] == ['remind@clemson.edu']
+    assert [member.email for member in plan.expired] == ['expired@clemson.edu']
+    assert plan.accept == []
+
+def test_expired_members_no_longer_on_tigerquest_are_still_expired():
+    reconciler = reconcile([sheet_member('left@clemson.edu', Status.REMINDER_SENT, 10)], [])
+    assert [member.email for member in reconciler.plan({}, NOW).expired] == ['left@clemson.edu']
+
+def test_conflicts_are_accepted_members_still_on_tigerquest():
+    stuck = sheet_member('stuck@clemson.edu', Status.ACCEPTED)
+    done = sheet_member('done@clemson.edu', Status.ACCEPTED)
+    reconciler = reconcile([stuck, done], [tq_member('stuck@clemson.edu')])
+
+    plan = reconciler.plan({'stuck@clemson.edu': '123456789'}, NOW)
+
+    assert plan.conflicts == [stuck]
+    assert plan.accept == []
+
+def test_accept_candidates_are_unaccepted_members_on_tigerquest():
+    members = [
+        sheet_member('pending@clemson.edu', Status.EMAIL_SENT),
+        sheet_member('accepted@clemson.edu', Status.ACCEPTED),
+        sheet_member('offline@clemson.edu', Status.EMAIL_SENT),
+    ]
+    reconciler = reconcile(members, [tq_member('pending@clemson.edu'), tq_member('accepted@clemson.edu')])
+    assert [member.email for member in reconciler.accept_candidates()] == ['pending@clemson.edu']
@@ -0,0 +1,57 @@
+import pytest
+import roster
+import storage
+from members import Member
+
+def member(number: int) -> Member:
+    return Member(f'Member{number}', f'member{number}@clemson.edu', page_id=f'/profile/{number}')
+
+def scan_pages(pages: list[list[Member]], marker: str = 'Showing 1 - 2 of 4') -> tuple[roster.RosterScan, list[int]]:
+    '''
+    Runs a scan over the pages, and returns it with the numbers of the pages whose members were read.
+    '''
+    scan = roster.RosterScan()
+    read = []
+    for page_number, members in enumerate(pages, start=1):
+        def read_members(page_number=page_number, members=members):
+            read.append(page_number)
+            return members
+        scan.page(page_number, [member.page_id for member in members], [marker], read_members)
+    scan.finish()
+    return scan, read
+
+@pytest.fixture(autouse=True)
+def empty_roster():
+    storage.execute('DELETE FROM roster_pages')
+
+def test_unchanged_pages_are_not_read_again():
+    pages = [[member(1), member(2)], [member(3), member(4)]]
+    first, read = scan_pages(pages)
+    assert read == [1, 2]
+    assert [change.member.email for change in first.changes] == [member.email for page in pages for member in page]
+
+    second, read = scan_pages(pages)
+    assert read == []
+    assert second.changes == []
+    assert [member.email for member in second.members] == [member.email for page in pages for member in page]
+
+def test_changed_pages_are_read_and_reported():
+    scan_pages([[member(1), member(2)], [member(3), member(4)]])
+
+    # member 2 leaves, so member 3 moves up to the first page and member 5 joins the end
+    scan, read = scan_pages([[member(1), member(3)], [member(4), member(5)]])
+
+    assert read == [1, 2]
+    assert [(change.kind, change.member.email) for change in scan.changes] == [('added', 'member5@clemson.edu'), ('removed', 'member2@clemson.edu')]
+
+def test_a_new_total_changes_the_fingerprint():
+    scan_pages([[member(1), member(2)]])
+    scan, read = scan_pages([[member(1), member(2)]], marker='Showing 1 - 2 of 3')
+    assert read == [1]
+    assert scan.changes == []
+
+def test_old_pages_are_read_again(monkeypatch):
+    scan_pages([[member(1), member(2)]])
+    monkeypatch.setattr(roster.cache, 'TTL_SECONDS', -1)
+    scan, read = scan_pages([[member(1), member(2)]])
+    assert read == [1]
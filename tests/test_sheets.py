@@ -0,0 +1,86 @@
+import pytest
+import fakes
+import sheets
+
+HEADER = ['Name', 'Email', 'Membership ID', 'Status', 'Status Date']
+NEW_ROW = ['New', 'new@clemson.edu', '', 'EMAIL SENT', '03/20/26']
+
+@pytest.fixture
+def worksheet(monkeypatch):
+    # rows 2 to 7 hold member1 to member6
+    values = [HEADER] + [[f'Member{index}', f'member{index}@clemson.edu', '', 'EMAIL SENT', '03/01/26'] for index in range(1, 7)]
+    worksheet = fakes.FakeWorksheet(values, latency=0, quota_per_minute=None)
+    monkeypatch.setattr(sheets, 'worksheet_factory', lambda: worksheet)
+    monkeypatch.setattr(sheets, 'worksheet', None)
+    monkeypatch.setattr(sheets, 'write_buffer', sheets.SheetWriteBuffer())
+    sheets.get_snapshot()
+    return worksheet
+
+def emails(worksheet: fakes.FakeWorksheet) -> list[str]:
+    return [row[1] for row in worksheet.values[1:]]
+
+def test_flush_sends_every_change_in_a_few_requests(worksheet):
+    sheets.write_buffer.update_cells('member5@clemson.edu', {4: 'REMINDER SENT'})
+    sheets.write_buffer.delete_row('member2@clemson.edu')
+    sheets.write_buffer.delete_row('member4@clemson.edu')
+    sheets.write_buffer.append_row(list(NEW_ROW))
+    sheets.flush()
+
+    assert emails(worksheet) == ['member1@clemson.edu', 'member3@clemson.edu', 'member5@clemson.edu', 'member6@clemson.edu', 'new@clemson.edu']
+    assert worksheet.values[3][3] == 'REMINDER SENT'
+    assert worksheet.calls['batch_update'] == 1
+    assert worksheet.calls['append_rows'] == 1
+    assert len(sheets.write_buffer) == 0
+
+def test_changes_to_a_new_row_are_made_before_it_is_appended(worksheet):
+    sheets.write_buffer.append_row(list(NEW_ROW))
+    sheets.write_buffer.update_cells('new@clemson.edu', {4: 'REMINDER SENT'})
+    sheets.flush()
+
+    assert worksheet.values[-1] == ['New', 'new@clemson.edu', '', 'REMINDER SENT', '03/20/26']
+    assert worksheet.calls['batch_update'] == 0
+
+def test_deleting_a_new_row_drops_it(worksheet):
+    sheets.write_buffer.append_row(list(NEW_ROW))
+    sheets.write_buffer.delete_row('new@clemson.edu')
+    sheets.flush()
+
+    assert 'new@clemson.edu' not in emails(worksheet)
+    assert worksheet.calls['append_rows'] == 0
+
+def test_flush_moves_the_row_index_with_the_sheet(worksheet):
+    sheets.write_buffer.delete_row('member2@clemson.edu')
+    sheets.write_buffer.delete_row('member4@clemson.edu')
+    sheets.write_buffer.append_row(list(NEW_ROW))
+    sheets.flush()
+
+    assert sheets.row_index == {
+        'member1@clemson.edu': 2,
+        'member3@clemson.edu': 3,
+        'member5@clemson.edu': 4,
+        'member6@clemson.edu': 5,
+        'new@clemson.edu': 6,
+    }
+    assert sheets.last_row == 6
+
+def test_updates_after_a_shift_go_to_the_right_rows(worksheet):
+    sheets.write_buffer.delete_row('member1@clemson.edu')
+    sheets.flush()
+    sheets.write_buffer.update_cells('member6@clemson.edu', {3: '123456789', 4: 'APPROVED'})
+    sheets.write_buffer.delete_row('member3@clemson.edu')
+    sheets.flush()
+
+    assert emails(worksheet) == ['member2@clemson.edu', 'member4@clemson.edu', 'member5@clemson.edu', 'member6@clemson.edu']
+    assert worksheet.values[4][2:4] == ['123456789', 'APPROVED']
+    # the row index still matched the sheet, so it was not read again
+    assert worksheet.calls['get_values'] == 1
+
+def test_the_index_is_rebuilt_when_the_sheet_was_edited_by_hand(worksheet):
+    # someone deletes member1's row by hand, so every row below it moves up
+    del worksheet.values[1]
+    sheets.write_buffer.update_cells('member3@clemson.edu', {4: 'APPROVED'})
+    sheets.flush()
+
+    assert worksheet.values[2][1:4] == ['member3@clemson.edu', '', 'APPROVED']
+    assert worksheet.values[1][3] == 'EMAIL SENT'
+    assert sheets.row_index['member3@clemson.edu'] == 3
@@ -8,31 +8,201 @@ for security, and not great for somebody trying to make a hacky automation scrip
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 from settings import settings
-from time import sleep
+from time import perf_counter
+from typing import Callable
 from log import logger
 from gmail import send_critical_email
+from members import Member
+from dataclasses import replace
+import cache
+import readiness
+import metrics
+import roster
 from sys import exit
+import os
 
 PROSPECTIVE_MEMBER_URL = settings['TigerQuest']['prospective_member_url']
 LOGIN_DOMAIN = settings['ClemsonAuth']['login_domain']
+BLOCK_RESOURCES = settings['SeleniumDriver'].get('block_resources', False)
+
+# requests blocked when block_resources is on: images, fonts, and analytics scripts are never needed to read the roster
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*analytics.js*',
+]
 
 '''UTILITY FUNCTIONS'''
 def initialize_driver() -> webdriver.Chrome:
     '''
     Returns a webdriver object for the TigerQuest prospective member page.
     AKA Opens a new chrome browser.
+
+    The [SeleniumDriver] section of auth.toml sets how Chrome is launched: headless, window_size,
+    block_resources, and user_data_dir, a folder for the Chrome profile so that the SSO cookies are
+    kept when the browser is restarted.
     '''
-    path = settings['SeleniumDriver']['path']
+    driver_settings = settings['SeleniumDriver']
+    path = driver_settings['path']
     if path == '':
         path = None
+
+    options = webdriver.ChromeOptions()
+    options.add_argument('--disable-extensions')
+    if driver_settings.get('headless', False):
+        # there is nothing to draw on screen, so the GPU process is not needed either
+        options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+    window_size = driver_settings.get('window_size')
+    if window_size:
+        options.add_argument(f'--window-size={window_size[0]},{window_size[1]}')
+    if driver_settings.get('user_data_dir', ''):
+        options.add_argument(f"--user-data-dir={os.path.abspath(driver_settings['user_data_dir'])}")
+    if BLOCK_RESOURCES:
+        # images are turned off for every tab here, the rest is blocked in each tab by block_requests
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
     service = webdriver.ChromeService(executable_path=path)
-    driver = webdriver.Chrome(service=service)
+    driver = webdriver.Chrome(service=service, options=options)
+    block_requests(driver)
     return driver
 
+def block_requests(driver: webdriver.Chrome):
+    '''
+    Stops the current tab from loading anything that matches BLOCKED_URL_PATTERNS, if block_resources is on.
+    '''
+    if not BLOCK_RESOURCES:
+        return
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except WebDriverException:
+        logger.warning('Failed to block images, fonts, and analytics in the browser.', exc_info=True)
+
+def process_tree_rss_mb(pid: int) -> float:
+    '''
+    Returns the total resident memory of a process and every process it started, in megabytes.
+    Only works on Linux, returns 0 elsewhere.
+    '''
+    if not os.path.isdir('/proc'):
+        return 0
+    children = {}
+    for child in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{child}/stat') as f:
+                parent = f.read().rsplit(')', 1)[1].split()[1]
+            children.setdefault(parent, []).append(child)
+        except (OSError, IndexError):
+            continue
+
+    total_kb = 0
+    pending = [str(pid)]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+class BrowserSession:
+    '''
+    Keeps a single Chrome browser open so that every TigerQuest operation in a loop (and across
+    loops) can share it instead of starting Chrome and logging in through SSO each time.
+
+    The browser is replaced when it stops responding, after it has been handed out max_uses times
+    (once for each stage that uses it, so a few times per loop), or when chromedriver and the Chrome
+    processes it started use more than max_memory_mb of memory. Both limits can be set in the
+    [SeleniumDriver] section of auth.toml. New browsers are started by driver_factory.
+    '''
+    def __init__(self, driver_factory: Callable[[], webdriver.Chrome] = initialize_driver):
+        self.driver_factory = driver_factory
+        driver_settings = settings.get('SeleniumDriver', {})
+        self.max_uses = driver_settings.get('max_uses', 50)
+        self.max_memory_mb = driver_settings.get('max_memory_mb', 1024)
+        self.driver = None
+        self.uses = 0
+
+    def acquire(self) -> webdriver.Chrome:
+        '''
+        Returns a working browser, starting a new one only if there is no usable browser open.
+        '''
+        start = perf_counter()
+        if self.driver is not None:
+            if not self.is_healthy():
+                logger.warning('Browser is no longer responding, starting a new one.')
+                self.close()
+            elif self.uses >= self.max_uses:
+                logger.info(f'Browser has been used {self.uses} times, recycling it.')
+                self.close()
+            elif self.memory_mb() > self.max_memory_mb:
+                logger.info(f'Browser is using more than {self.max_memory_mb}MB of memory, recycling it.')
+                self.close()
+
+        cold_start = self.driver is None
+        if not cold_start:
+            self.close_extra_tabs()
+        else:
+            with metrics.timer('browser', 'start'):
+                self.driver = self.driver_factory()
+            self.uses = 0
+        self.uses += 1
+
+        elapsed = perf_counter() - start
+        if cold_start:
+            logger.info(f'Started new browser in {elapsed:.2f} seconds.')
+        else:
+            logger.info(f'Reused browser (use {self.uses} of {self.max_uses}) in {elapsed:.2f} seconds.')
+        return self.driver
+
+    def is_healthy(self) -> bool:
+        '''
+        Returns True if the browser still responds to commands.
+        '''
+        try:
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def memory_mb(self) -> float:
+        '''
+        Returns the resident memory of the browser in megabytes, or 0 if there is no browser open.
+        '''
+        if self.driver is None:
+            return 0
+        process = getattr(self.driver.service, 'process', None)
+        return process_tree_rss_mb(process.pid) if process is not None else 0
+
+    def close_extra_tabs(self):
+        '''
+        Closes any tabs left open by an interrupted scrape so the browser starts from its first tab.
+        '''
+        handles = self.driver.window_handles
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
+
+    def close(self):
+        '''
+        Quits the browser if one is open.
+        '''
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                logger.debug('Browser was already gone when closing it.')
+            self.driver = None
+            self.uses = 0
+
 def selenium_test():
     '''
     Tests the selenium driver by opening the TigerQuest prospective member page.
@@ -60,8 +230,8 @@ def clemson_login(driver: webdriver.Chrome):
         # type the username and password into the login form
         driver.find_element(By.ID, 'username').send_keys(username)
         driver.find_element(By.ID, 'password').send_keys(password)
-        sleep(2) # sleep for 2 seconds
-        driver.find_element(By.ID, 'submitButton').click()
+        # wait for the login form to accept the submission instead of sleeping
+        readiness.wait_until(driver, 'login_form', EC.element_to_be_clickable((By.ID, 'submitButton')), 10).click()
 
 def wait_for_member_list(driver: webdriver.Chrome):
     '''
@@ -69,19 +239,26 @@ def wait_for_member_list(driver: webdriver.Chrome):
     '''
     try:
         logger.debug('Waiting for svgGrid (member listings) to appear...')
-        WebDriverWait(driver, 60).until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'svgGrid')))
-        logger.debug('Found svgGrid, continuing after one second...')
-        sleep(1) # wait one second just to be sure
-    except TimeoutError:
-        logger.error("Failed to find svgGrid (member listings) within 60 seconds.")
-        raise TimeoutError("Failed to find list of members within 60 seconds.")
+        readiness.wait_until(driver, 'member_list', EC.presence_of_all_elements_located((By.CLASS_NAME, 'svgGrid')), 60)
+    except TimeoutException:
+        logger.error("Failed to find svgGrid (member listings) in time.")
+        raise TimeoutError("Failed to find list of members in time.")
+
+    # the member list is already there, so a page that never goes quiet is read anyway
+    try:
+        logger.debug('Found svgGrid, waiting for the page to finish loading...')
+        readiness.wait_until(driver, 'member_list_idle', readiness.page_is_idle, 10)
+    except TimeoutException:
+        logger.debug('Roster page was still busy after 10 seconds, reading it anyway.')
 
-def load_prospective_member_page(driver: webdriver.Chrome):
+def load_prospective_member_page(driver: webdriver.Chrome, url: str = PROSPECTIVE_MEMBER_URL):
     '''
     Opens the prospective member page in TigerQuest and logs in if necessary.
+    A later page of the roster can be opened by passing its url.
     '''
     logger.debug('Loading propsective members page.')
-    driver.get(PROSPECTIVE_MEMBER_URL)
+    with metrics.timer('tigerquest', 'roster_page'):
+        driver.get(url)
 
     # login if necessary
     clemson_login(driver)
@@ -89,77 +266,156 @@ def load_prospective_member_page(driver: webdriver.Chrome):
     # wait for the member grid to load
     wait_for_member_list(driver)
 
-def fetch_prospective_members() -> list[dict[str, str]]:
+def open_tab(driver: webdriver.Chrome, url: str) -> str:
     '''
-    Opens the TigerQuest page and returns a list of the prospective members.
-    The returned object is a list of dictionaries, where each dictionary contains
-    the attributes 'name' and 'email'.
+    Opens the url in a new tab without switching to it and returns the new tab's window handle.
     '''
-    logger.info('Fetching prospective members...')
-    driver = initialize_driver() # Create a new webdriver
-    load_prospective_member_page(driver) # open TigerQuest page
-
-    # get a list of all the member-modal class elements that are links, as they contain the names of the users
-
-    member_info = []
-
-    def get_member_info_for_page():
-        # double check the member grid exists
-        wait_for_member_list(driver)
-
-        # find all elements identified by a.member-modal
-        name_elements = driver.find_elements(By.XPATH, "//table//a[contains(@class, 'member-modal')]")
-
-        # extract the href attributes from each element
-        name_element_hrefs = [element.get_attribute('href') for element in name_elements]
-
-        # for each url, open in a new tab and extract the name and email, then save to member info
-        for url in name_element_hrefs:
-            logger.debug(f'Opening window to get information for url {url}')
-            # open a new tab with javascript
-            driver.execute_script("window.open('');")
-
-            # switch to the new tab
-            driver.switch_to.window(driver.window_handles[-1])
+    if BLOCK_RESOURCES:
+        # blocking is set up per tab, so the tab has to exist before the url starts loading
+        current_handle = driver.current_window_handle
+        driver.switch_to.new_window('tab')
+        block_requests(driver)
+        driver.execute_script('window.location.href = arguments[0];', url)
+        handle = driver.current_window_handle
+        driver.switch_to.window(current_handle)
+        return handle
+
+    existing_handles = set(driver.window_handles)
+    driver.execute_script("window.open(arguments[0], '_blank');", url)
+    return next(handle for handle in driver.window_handles if handle not in existing_handles)
+
+def scrape_member_profile(driver: webdriver.Chrome) -> Member:
+    '''
+    Reads the name and email from the member profile open in the current tab.
+    '''
+    # wait for the page to load
+    readiness.wait_until(driver, 'member_profile', EC.presence_of_element_located((By.CLASS_NAME, 'userCard-section')), 10)
 
-            # navigate to the new URL in the new tab
-            driver.get(url)
+    name = driver.find_element(By.CSS_SELECTOR, 'span.fn').text
+    email = driver.find_element(By.CSS_SELECTOR, 'a.email').get_attribute('href')[7:]
+    return Member(name, email)
 
-            # wait for the page to load
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CLASS_NAME, 'userCard-section')))
+def fetch_member_profiles(driver: webdriver.Chrome, urls: list[str]) -> list[Member]:
+    '''
+    Returns the name and email for each member profile url, in the same order as the urls.
 
-            # get the name and email from the new tab
-            name = driver.find_element(By.CSS_SELECTOR, 'span.fn').text
-            email = driver.find_element(By.CSS_SELECTOR, 'a.email').get_attribute('href')[7:]
-            member_info.append({
-                'name': name,
-                'email': email
-            })
+    Up to profile_concurrency tabs (set in the [TigerQuest] section of auth.toml) are kept loading
+    at once, so the browser fetches several profiles in parallel while the bot reads the one in front.
+    Profiles that fail to load are retried one at a time afterwards.
+    '''
+    concurrency = max(1, settings['TigerQuest'].get('profile_concurrency', 4))
+    main_handle = driver.current_window_handle
+    profiles = [None] * len(urls)
+    failed = []
+
+    # keep a sliding window of open tabs so the next profiles load while the current one is read
+    open_handles = {}
+    for index in range(min(concurrency, len(urls))):
+        open_handles[index] = open_tab(driver, urls[index])
+
+    for index, url in enumerate(urls):
+        logger.debug(f'Reading tab to get information for url {url}')
+        driver.switch_to.window(open_handles.pop(index))
+        try:
+            with metrics.timer('tigerquest', 'profile'):
+                profiles[index] = scrape_member_profile(driver)
+            logger.debug(f'Found info for member {profiles[index].name}')
+        except (TimeoutException, NoSuchElementException):
+            logger.debug(f'Failed to read profile at {url}, will retry it.')
+            failed.append(index)
+
+        # close the current tab, then open the next profile in line
+        driver.close()
+        driver.switch_to.window(main_handle)
+        if index + concurrency < len(urls):
+            open_handles[index + concurrency] = open_tab(driver, urls[index + concurrency])
+
+    # retry failed profiles one at a time, in case they failed because too much was loading at once
+    for index in failed:
+        logger.debug(f'Retrying profile at {urls[index]}')
+        driver.switch_to.window(open_tab(driver, urls[index]))
+        try:
+            with metrics.timer('tigerquest', 'profile'):
+                profiles[index] = scrape_member_profile(driver)
+        finally:
+            driver.close()
+            driver.switch_to.window(main_handle)
 
-            logger.debug(f'Found info for member {name}')
+    return profiles
 
-            # close the current tab
-            driver.close()
+def iter_roster_pages(driver: webdriver.Chrome, url: str = PROSPECTIVE_MEMBER_URL, page_number: int = 1):
+    '''
+    Opens each page of the prospective member roster in turn, starting at url, and yields the
+    page number and url of the page that is currently open in the driver. The next page is only
+    loaded once the caller asks for it, so the caller can work with each page as it arrives.
+    '''
+    load_prospective_member_page(driver, url)
+    while True:
+        # double check the member grid exists
+        wait_for_member_list(driver)
+        yield page_number, driver.current_url
 
-            # switch back to original tab
-            driver.switch_to.window(driver.window_handles[0])
-        
-        # check to see if the next button is present, and if so, click it and call the function again
+        # check to see if the next button is present, and if so, move on to the next page
         try:
             next_button = driver.find_element(By.XPATH, "//span[@class='paginationRight']//a[text()='next']")
-            # if this didn't fail, then the next button is present, click it and call the function again
-            logger.debug('Found next page button, moving to next page...')
-            driver.get(next_button.get_attribute('href'))
-            get_member_info_for_page()
         except NoSuchElementException:
             # if the next button is not present, then we're done
             logger.debug("Didn't find next page button. We're done here!")
             return
-    
-    get_member_info_for_page()
-    driver.close()
+        logger.debug('Found next page button, moving to next page...')
+        with metrics.timer('tigerquest', 'roster_page'):
+            driver.get(next_button.get_attribute('href'))
+        page_number += 1
+
+def get_member_info_for_page(driver: webdriver.Chrome, page_number: int, page_url: str) -> list[Member]:
+    '''
+    Returns the members listed on the roster page that is currently open in the driver.
+    '''
+    # find every table row with an a.member-modal link, and read the link and the member's checkbox id from it
+    rows = driver.find_elements(By.XPATH, "//table//tr[.//a[contains(@class, 'member-modal')]]")
+    name_element_hrefs = []
+    page_ids = []
+    for row in rows:
+        name_element_hrefs.append(row.find_element(By.XPATH, ".//a[contains(@class, 'member-modal')]").get_attribute('href'))
+        checkboxes = row.find_elements(By.CSS_SELECTOR, "input[type='checkbox']")
+        page_ids.append(checkboxes[0].get_attribute('value') if checkboxes else None)
+
+    # look up the profiles, opening the ones that are not cached several tabs at a time
+    profiles = cache.get_profiles(name_element_hrefs, lambda urls: fetch_member_profiles(driver, urls))
+    member_info = []
+    for profile, page_id in zip(profiles, page_ids):
+        member_info.append(replace(
+            profile,
+            page_id=page_id or get_member_page_id(driver, profile.name),
+            page_url=page_url,
+            page_number=page_number
+        ))
     return member_info
 
+def get_roster_page_markers(driver: webdriver.Chrome) -> tuple[list[str], list[str]]:
+    '''
+    Returns the member profile links on the roster page that is currently open in the driver,
+    and its pagination markers (the text and links of the pagination bar), for roster.page_fingerprint.
+    '''
+    hrefs = [link.get_attribute('href') for link in driver.find_elements(By.XPATH, "//table//a[contains(@class, 'member-modal')]")]
+    markers = []
+    for element in driver.find_elements(By.XPATH, "//span[contains(@class, 'pagination')]"):
+        markers.append(element.text)
+        markers.extend(link.get_attribute('href') for link in element.find_elements(By.TAG_NAME, 'a'))
+    return hrefs, markers
+
+def iter_roster_changes(driver: webdriver.Chrome, scan: roster.RosterScan, url: str = PROSPECTIVE_MEMBER_URL, page_number: int = 1):
+    '''
+    Yields the changes to the roster since the last scrape, as roster.RosterChange events. Pages
+    that have not changed are not read again. New members are yielded as their page is read, and
+    the members who have left the roster once every page has been read.
+    '''
+    logger.info('Checking the roster for changes...')
+    for page_number, page_url in iter_roster_pages(driver, url, page_number):
+        hrefs, markers = get_roster_page_markers(driver)
+        yield from scan.page(page_number, hrefs, markers, lambda: get_member_info_for_page(driver, page_number, page_url))
+    yield from scan.finish()
+
 def get_member_page_id(driver: webdriver.Chrome, name: str):
     '''
     Returns the id of the member's page on the TigerQuest page.
@@ -171,108 +427,106 @@ def get_member_page_id(driver: webdriver.Chrome, name: str):
     except NoSuchElementException:
         return None
 
-def accept_member(driver: webdriver.Chrome, member: dict[str, str]):
-    '''
-    Accepts a member by clicking the reject button on the TigerQuest page.
-    Does not load the tigerQuest page.
+def run_member_action(driver: webdriver.Chrome, members: list[Member], action: str) -> list[Member]:
     '''
-    logger.debug(f'Accepting member {member["name"]}...')
-    load_prospective_member_page(driver)
-    wait_for_member_list(driver)
+    Runs the TigerQuest accept ('approve') or reject ('deny') action for every member, using the
+    page_id and page_url recorded by get_member_info_for_page. Each roster page is loaded once and
+    the actions for all of its members are started together, then the bot waits for them all to finish.
 
-    def attempt_to_accept():
-        # find the id for the specific member
-        id = get_member_page_id(driver, member['name'])
-        if id is None:
-            # the id is not found on this page, go to the next page
-            try:
-                next_button = driver.find_element(By.XPATH, "//span[@class='paginationRight']//a[text()='next']")
-                # if this didn't fail, then the next button is present, click it and call the function again
-                driver.get(next_button.get_attribute('href'))
-                attempt_to_accept()
-                return
-            except NoSuchElementException:
-                # if the next button is not present, then we're done
-                logger.debug(f'Failed to find member {member["name"]} on TigerQuest to accept.')
-                return
-            
-        # if the id is found
-        else:
-            # run javascript to accept the user
-            if settings.get('Debug') != True:
-                driver.execute_script(f"ApproveMember('{settings['TigerQuest']['approve_member_url']}{id}');")
-            
-                # wait for the user's profile to disappear
-                try:
-                    wait = WebDriverWait(driver, 30) # wait for up to 30 seconds
-                    wait.until(EC.invisibility_of_element_located((By.CSS_SELECTOR, f"input[title='{member['name']}']")))
-                except TimeoutError:
-                    logger.critical(f'Failed to add member {member["name"]} to TigerQuest. Sending critical error email.')
-                    send_critical_email(f'Failed to add member {member["name"]} to TigerQuest. This could indicate a network issue or that there is an issue with the accept_member_url in the settings file. The program will now stop to avoid any further issues.')
-                    exit(1)
-    
-    attempt_to_accept()
-
-def accept_members(members: list[dict[str, str]]):
-    '''
-    accepts a list of members by clicking the accept button on the TigerQuest page.
+    Pages are handled from last to first so that removing members never shifts members on pages
+    that have not been handled yet. Returns the members that could not be found where the index
+    said they would be, so the caller can fall back to searching for them.
     '''
-    driver = initialize_driver()
-
+    if action == 'approve':
+        script = 'ApproveMember'
+        url_setting = 'approve_member_url'
+    else:
+        script = 'DenyMember'
+        url_setting = 'reject_member_url'
+    action_url = settings['TigerQuest'][url_setting]
+
+    not_found = []
+    pages = {}
     for member in members:
-        accept_member(driver, member)
-    
-    driver.close()
+        if member.page_id is None or member.page_url is None:
+            not_found.append(member)
+        else:
+            pages.setdefault((member.page_number, member.page_url), []).append(member)
 
-def reject_member(driver: webdriver.Chrome, member: dict[str, str]):
-    '''
-    Rejects a member by clicking the reject button on the TigerQuest page.
-    Does not load the tigerQuest page.
-    '''
-    logger.debug(f'Rejecting member {member["name"]}...')
-    load_prospective_member_page(driver)
-    wait_for_member_list(driver)
+    for (page_number, page_url), page_members in sorted(pages.items(), reverse=True):
+        logger.debug(f'Running {script} for {len(page_members)} members on roster page {page_number}...')
+        load_prospective_member_page(driver, page_url)
 
-    def attempt_to_remove():
-        # find the id for the specific member
-        id = get_member_page_id(driver, member['name'])
-        if id is None:
-            # the id is not found on this page, go to the next page
-            try:
-                next_button = driver.find_element(By.XPATH, "//span[@class='paginationRight']//a[text()='next']")
-                # if this didn't fail, then the next button is present, click it and call the function again
-                driver.get(next_button.get_attribute('href'))
-                attempt_to_remove()
-                return
-            except NoSuchElementException:
-                # if the next button is not present, then we're done
-                logger.debug(f'Failed to find member {member["name"]} on TigerQuest to remove.')
-                return
-            
-        # if the id is found
-        else:
-            # run javascript to reject the user
+        started = []
+        for member in page_members:
+            if len(driver.find_elements(By.CSS_SELECTOR, f"input[value='{member.page_id}']")) == 0:
+                not_found.append(member)
+                continue
             if settings.get('Debug') != True:
-                driver.execute_script(f"DenyMember('{settings['TigerQuest']['reject_member_url']}{id}');")
+                with metrics.timer('tigerquest', action):
+                    driver.execute_script(f"{script}('{action_url}{member.page_id}');")
+            started.append(member)
+
+        if settings.get('Debug') == True:
+            continue
 
-                # wait for the user's profile to disappear
-                try:
-                    wait = WebDriverWait(driver, 30) # wait for up to 30 seconds
-                    wait.until(EC.invisibility_of_element_located((By.CSS_SELECTOR, f"input[title='{member['name']}']")))
-                except TimeoutError:
-                    logger.critical(f'Failed to remove member {member["name"]} from TigerQuest. Sending critical error email.')
-                    send_critical_email(f'Failed to remove member {member["name"]} from TigerQuest. This could indicate a network issue or that there is an issue with the reject_member_url in the settings file. The program will now stop to avoid any further issues.')
-                    exit(1)
-    
-    attempt_to_remove()
+        # wait for each member's checkbox to disappear, which means TigerQuest has finished with them
+        for member in started:
+            try:
+                # wait for up to 30 seconds
+                readiness.wait_until(driver, f'{action}_member', EC.invisibility_of_element_located((By.CSS_SELECTOR, f"input[value='{member.page_id}']")), 30, adaptive=False)
+            except TimeoutException:
+                logger.critical(f'Failed to {action} member {member.name} on TigerQuest. Sending critical error email.')
+                send_critical_email(f'Failed to {action} member {member.name} on TigerQuest. This could indicate a network issue or that there is an issue with the {url_setting} in the settings file. The program will now stop to avoid any further issues.')
+                exit(1)
 
-def reject_members(members: list[dict[str, str]]):
+    return not_found
+
+def locate_members(driver: webdriver.Chrome, members: list[Member]) -> tuple[list[Member], list[Member]]:
     '''
-    Rejects a list of members by clicking the reject button on the TigerQuest page.
+    Walks the roster once to find where each member is listed now, for members that were not where
+    the index said they would be (because members before them were accepted or rejected since the
+    scrape, for example). Members are matched by their page_id, or by name if it is not known.
+    Returns the members that were found, with their current page, and the members that were not.
     '''
-    driver = initialize_driver()
+    located = []
+    remaining = list(members)
+    for page_number, page_url in iter_roster_pages(driver):
+        still_missing = []
+        for member in remaining:
+            page_id = member.page_id if member.page_id is not None else get_member_page_id(driver, member.name)
+            if page_id is not None and len(driver.find_elements(By.CSS_SELECTOR, f"input[value='{page_id}']")) > 0:
+                located.append(replace(member, page_id=page_id, page_url=page_url, page_number=page_number))
+            else:
+                still_missing.append(member)
+        remaining = still_missing
+        if len(remaining) == 0:
+            break
+    return located, remaining
+
+def run_member_action_anywhere(driver: webdriver.Chrome, members: list[Member], action: str):
+    '''
+    Runs the TigerQuest accept ('approve') or reject ('deny') action for every member. Members that
+    are not where the index said they would be are found with a single walk of the roster, and
+    their actions are then run like the rest, so this never costs more than one walk per batch.
+    '''
+    missing = run_member_action(driver, members, action)
+    if len(missing) == 0:
+        return
+    logger.debug(f'{len(missing)} members were not on their indexed roster page, searching the roster for them...')
+    located, not_found = locate_members(driver, missing)
+    not_found += run_member_action(driver, located, action)
+    for member in not_found:
+        logger.debug(f'Failed to find member {member.name} on TigerQuest to {action}.')
+
+def accept_members(driver: webdriver.Chrome, members: list[Member]):
+    '''
+    accepts a list of members by clicking the accept button on the TigerQuest page.
+    '''
+    run_member_action_anywhere(driver, members, 'approve')
 
-    for member in members:
-        reject_member(driver, member)
-    
-    driver.close()
+def reject_members(driver: webdriver.Chrome, members: list[Member]):
+    '''
+    Rejects a list of members by clicking the reject button on the TigerQuest page.
+    '''
+    run_member_action_anywhere(driver, members, 'deny')